@@ -0,0 +1,137 @@
+"""
+Hot-SKU checkout benchmark: python -m benchmarks.checkout_modes [buyers] [stock] [qty]
+
+Seeds one product with `stock` units, then has `buyers` users check out `qty`
+units of it at the same time, once per checkout mode. For each mode it prints
+throughput, the abort rate (checkouts refused for stock) and oversell (units
+ordered beyond the seeded stock). The "+holds" modes first have every buyer
+race for a stock hold (/checkout/start/) and then check out, so hold/consume
+contention is covered too. The transaction modes need a replica set and are
+skipped without one.
+
+It writes to the collections of the configured DB_URI and removes only what it
+created, so point DB_URI at a scratch deployment.
+"""
+import asyncio
+import sys
+import time
+from datetime import datetime
+from uuid import uuid4
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+from db.db import db, client
+from routes.order.order import CHECKOUT_STATS, _checkout_compensated, _checkout_in_transaction
+from utils import reservations
+
+# mode -> (checkout path, take a hold first)
+MODES = {
+    "compensated": (_checkout_compensated, False),
+    "transaction": (_checkout_in_transaction, False),
+    "compensated+holds": (_checkout_compensated, True),
+    "transaction+holds": (_checkout_in_transaction, True),
+}
+
+
+async def _supports_transactions() -> bool:
+    hello = await client.admin.command("hello")
+    return "setName" in hello or hello.get("msg") == "isdbgrid"
+
+
+async def run_mode(mode: str, buyers: int, stock: int, qty: int) -> dict:
+    checkout, with_holds = MODES[mode]
+    run_id = uuid4().hex
+    seller_id = ObjectId()
+    res = await db.product.insert_one({
+        "seller": seller_id,
+        "name": f"bench-{run_id}",
+        "price": 100.0,
+        "final_price": 100.0,
+        "stock": stock,
+        "category": "bench",
+        "created_at": datetime.utcnow(),
+    })
+    pid = str(res.inserted_id)
+    users = [ObjectId() for _ in range(buyers)]
+    outcomes = {"committed": 0, "aborted": 0, "errors": 0, "held": 0}
+    runs_before = CHECKOUT_STATS["transaction_runs"]
+
+    async def buy(user_id):
+        order_doc = {
+            "_id": ObjectId(),
+            "user": user_id,
+            "seller": seller_id,
+            "items": [{"item_id": pid, "quantity": qty}],
+            "status": "pending",
+            "bench": run_id,
+            "created_at": datetime.utcnow(),
+        }
+        try:
+            # a buyer whose hold was refused still tries the unheld path, as the API allows
+            if with_holds and await reservations.hold(user_id, pid, qty):
+                outcomes["held"] += 1
+            await checkout(user_id, [(pid, qty)], [order_doc], [])
+            outcomes["committed"] += 1
+        except HTTPException as e:
+            outcomes["aborted" if e.status_code == 400 else "errors"] += 1
+        except Exception:
+            outcomes["errors"] += 1
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*[buy(u) for u in users])
+        elapsed = time.perf_counter() - started
+
+        product = await db.product.find_one({"_id": res.inserted_id}, {"stock": 1})
+        orders = await db.order.count_documents({"bench": run_id})
+        leftover = await db.reservation.find({"item_id": pid}, {"quantity": 1}).to_list(length=None)
+    finally:
+        await db.reservation.delete_many({"item_id": pid})
+        await db.order.delete_many({"bench": run_id})
+        await db.product.delete_one({"_id": res.inserted_id})
+        await db.cart_total.delete_many({"_id": {"$in": users}})
+
+    ordered = orders * qty
+    still_held = sum(r["quantity"] for r in leftover)
+    return {
+        "mode": mode,
+        "elapsed": elapsed,
+        **outcomes,
+        # with_transaction re-runs the callback on write conflicts; each buyer's first run isn't a retry
+        "txn_retries": max(0, CHECKOUT_STATS["transaction_runs"] - runs_before - buyers),
+        "ordered": ordered,
+        "final_stock": product["stock"],
+        "still_held": still_held,
+        "oversell": max(0, ordered - stock),
+        # every unit is either still in stock, held (a failed checkout keeps its hold) or in an order
+        "unaccounted": stock - ordered - still_held - product["stock"],
+    }
+
+
+def _report(r: dict, buyers: int):
+    print(
+        f"{r['mode']:>18}: {buyers / r['elapsed']:8.1f} checkouts/s  "
+        f"held {r['held']:5d}  committed {r['committed']:5d}  "
+        f"aborted {r['aborted']:5d} ({r['aborted'] / buyers:6.1%})  "
+        f"errors {r['errors']:3d}  txn retries {r['txn_retries']:4d}  "
+        f"oversell {r['oversell']:4d}  final stock {r['final_stock']:5d}  "
+        f"still held {r['still_held']:4d}  unaccounted {r['unaccounted']:4d}"
+    )
+
+
+async def main(buyers: int, stock: int, qty: int):
+    print(f"{buyers} buyers x {qty} unit(s) against one SKU with {stock} in stock")
+    modes = ["compensated", "compensated+holds"]
+    if await _supports_transactions():
+        modes += ["transaction", "transaction+holds"]
+    else:
+        print("transaction modes skipped: DB_URI is not a replica set")
+    for mode in modes:
+        _report(await run_mode(mode, buyers, stock, qty), buyers)
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:4]]
+    n_buyers, n_stock, n_qty = args + [500, 100, 1][len(args):]
+    asyncio.run(main(n_buyers, n_stock, n_qty))
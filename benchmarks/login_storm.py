@@ -0,0 +1,75 @@
+"""
+Login-storm benchmark: python -m benchmarks.login_storm [logins] [probe_ms]
+
+Fires `logins` concurrent password checks two ways: "inline" runs bcrypt on
+the event loop as login did before the hash pool, "pool" goes through
+verify_and_update_async. For each it prints throughput, login p50/p99 measured
+from arrival, and the p99 lag of a probe_ms timer standing in for every other
+request on the worker.
+"""
+import asyncio
+import sys
+
+from utils.security import (
+    BCRYPT_ROUNDS,
+    PASSWORD_HASH_EXECUTOR,
+    PASSWORD_HASH_WORKERS,
+    hash_password,
+    shutdown_hash_pool,
+    verify_and_update_async,
+    verify_password,
+)
+
+PASSWORD = "bench-password"
+
+
+def _p(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] * 1000 if values else 0.0
+
+
+async def storm(mode: str, n_logins: int, probe_s: float, stored: str):
+    loop = asyncio.get_running_loop()
+    lags, latencies = [], []
+    done = asyncio.Event()
+
+    async def probe():
+        while not done.is_set():
+            start = loop.time()
+            await asyncio.sleep(probe_s)
+            lags.append(loop.time() - start - probe_s)
+
+    async def login(arrived):
+        # measured from arrival, so time spent waiting behind other logins counts
+        if mode == "inline":
+            verify_password(PASSWORD, stored)
+        else:
+            await verify_and_update_async(PASSWORD, stored)
+        latencies.append(loop.time() - arrived)
+
+    prober = asyncio.create_task(probe())
+    started = loop.time()
+    await asyncio.gather(*[login(started) for _ in range(n_logins)])
+    elapsed = loop.time() - started
+    done.set()
+    await prober
+    print(
+        f"{mode:>6}: {n_logins / elapsed:7.1f} logins/s  "
+        f"login p50 {_p(latencies, 0.5):8.1f} ms  p99 {_p(latencies, 0.99):8.1f} ms  "
+        f"loop lag p99 {_p(lags, 0.99):8.1f} ms"
+    )
+
+
+async def main(n_logins: int, probe_s: float):
+    print(f"{n_logins} concurrent logins, bcrypt rounds={BCRYPT_ROUNDS}, "
+          f"{PASSWORD_HASH_EXECUTOR} pool x{PASSWORD_HASH_WORKERS}")
+    stored = hash_password(PASSWORD)
+    await storm("inline", n_logins, probe_s, stored)
+    await storm("pool", n_logins, probe_s, stored)
+    shutdown_hash_pool()
+
+
+if __name__ == "__main__":
+    logins = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    probe_ms = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+    asyncio.run(main(logins, probe_ms / 1000))
@@ -0,0 +1,44 @@
+"""
+Order email render benchmark: python -m benchmarks.order_email_render [items_per_order]
+
+Times rendering the buyer email (three seller orders) and one seller email
+from the compiled Jinja2 templates.
+"""
+import sys
+import timeit
+from datetime import datetime
+
+from bson import ObjectId
+
+from utils.order_email import render_seller_email, render_user_email
+
+RUNS = 1000
+
+
+def main(n_items: int):
+    buyer = {"name": "Bench <User>", "email": "buyer@example.com"}
+    orders = [
+        {
+            "id": str(ObjectId()),
+            "seller": str(ObjectId()),
+            "status": "payment_pending",
+            "address": {"address": "1 Main St", "mobile_no": "9999999999"},
+            "items": [
+                {"title": f"Item {i}", "quantity": 2, "final_price": 99.5}
+                for i in range(n_items)
+            ],
+            "final_total": 199.0 * n_items,
+            "created_at": datetime.utcnow(),
+        }
+        for _ in range(3)
+    ]
+
+    user_s = timeit.timeit(lambda: render_user_email(buyer, orders, 597.0 * n_items), number=RUNS)
+    seller_s = timeit.timeit(lambda: render_seller_email("Bench Store", buyer, orders[0]), number=RUNS)
+    print(f"{n_items} items/order, 3 sellers")
+    print(f"buyer email:  {user_s / RUNS * 1e6:.1f} us/render")
+    print(f"seller email: {seller_s / RUNS * 1e6:.1f} us/render")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
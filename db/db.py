@@ -1,21 +1,17 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-import os
 from supabase import create_client, Client
-from dotenv import load_dotenv
-load_dotenv()
+from utils.settings import settings
 
 try:
-    client = AsyncIOMotorClient(os.getenv("DB_URI"))
+    client = AsyncIOMotorClient(settings.db_uri)
     db = client["ECommerce"]
 except Exception as e:
     print(f"❌ Error connecting: {e}")
 
 
 # ---------- Supabase config ----------
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_ROLE_KEY = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
-
-if not all([SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY]):
-    raise RuntimeError("Supabase environment variables are missing")
+# both are required settings, so a missing one already stopped startup
+SUPABASE_URL = settings.supabase_url
+SUPABASE_SERVICE_ROLE_KEY = settings.supabase_service_role_key.get_secret_value()
 
 supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_ROLE_KEY)
\ No newline at end of file
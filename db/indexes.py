@@ -0,0 +1,135 @@
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING, TEXT
+from pymongo.errors import DuplicateKeyError, OperationFailure
+from db.db import db
+from utils.utility import cart_total_save
+
+
+async def run_once(name: str, migration):
+    """
+    Run a data migration once per database: the first worker to insert its
+    marker into db.meta runs it, every later boot skips it. A failed run
+    removes the marker so the next boot tries again.
+    """
+    marker = f"migration:{name}"
+    try:
+        await db.meta.insert_one({"_id": marker, "started_at": datetime.utcnow()})
+    except DuplicateKeyError:
+        return
+    try:
+        await migration()
+    except Exception:
+        await db.meta.delete_one({"_id": marker})
+        raise
+    await db.meta.update_one({"_id": marker}, {"$set": {"finished_at": datetime.utcnow()}})
+
+
+async def backfill_product_timestamps():
+    """Give products written before created_at/updated_at existed their ObjectId time."""
+    await db.product.update_many(
+        {"created_at": {"$exists": False}},
+        [{"$set": {
+            "created_at": {"$toDate": "$_id"},
+            "updated_at": {"$ifNull": ["$updated_at", {"$toDate": "$_id"}]},
+        }}],
+    )
+
+
+LEGACY_OTP_FIELDS = {
+    "email_otp": "",
+    "email_otp_expires_at": "",
+    "reset_otp": "",
+    "reset_otp_expires_at": "",
+}
+
+
+async def drop_legacy_otp_fields():
+    """
+    OTPs live in db.otp now: strip the old copies off account documents, and
+    the codes out of OTP emails the outbox already finished with.
+    """
+    for coll in (db.user, db.seller):
+        await coll.update_many(
+            {"$or": [{field: {"$exists": True}} for field in LEGACY_OTP_FIELDS]},
+            {"$unset": LEGACY_OTP_FIELDS},
+        )
+    await db.email_outbox.update_many(
+        {"subject": "Your Verification OTP", "status": {"$in": ["sent", "failed"]}},
+        {"$unset": {"body": "", "text_body": ""}, "$set": {"redact": True}},
+    )
+
+
+async def drop_checkout_locks():
+    """Checkout no longer tags products while decrementing; clear tags left by older or crashed requests."""
+    await db.product.update_many(
+        {"checkout_locks": {"$exists": True}},
+        {"$unset": {"checkout_locks": ""}},
+    )
+
+
+async def unique_cart_lines():
+    """
+    Make (user, item_id) unique on db.cart so concurrent upserts of one line
+    can't both insert. Duplicates already there are collapsed onto the newest
+    line (its quantity is the last one set) and the cart totals recomputed.
+    """
+    dupes = db.cart.aggregate([
+        {"$group": {"_id": {"user": "$user", "item_id": "$item_id"}, "ids": {"$push": "$_id"}, "n": {"$sum": 1}}},
+        {"$match": {"n": {"$gt": 1}}},
+    ], allowDiskUse=True)
+    users = set()
+    async for group in dupes:
+        keep = max(group["ids"])
+        await db.cart.delete_many({"_id": {"$in": [i for i in group["ids"] if i != keep]}})
+        users.add(group["_id"]["user"])
+    for user_id in users:
+        await cart_total_save(user_id)
+
+    try:
+        await db.cart.drop_index("user_1_item_id_1")
+    except OperationFailure:
+        pass  # fresh database: the non-unique index never existed
+    await db.cart.create_index([("user", ASCENDING), ("item_id", ASCENDING)], unique=True)
+
+
+async def ensure_indexes():
+    """Create the indexes the list/search queries rely on (no-op if they exist)."""
+    # /all/products/ price sorts, _id is the keyset tie-breaker
+    await db.product.create_index([("final_price", ASCENDING), ("_id", ASCENDING)])
+    # seller /products/ listing, newest first
+    await db.product.create_index(
+        [("seller", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]
+    )
+    # /search/products/: one text index plus category/price/recency compounds
+    await db.product.create_index(
+        [("name", TEXT), ("description", TEXT)],
+        weights={"name": 10, "description": 2},
+        name="product_text",
+    )
+    # _id is part of every search sort, so it has to be in the key for the sort to come from the index
+    await db.product.create_index([("category", ASCENDING), ("final_price", ASCENDING), ("_id", ASCENDING)])
+    await db.product.create_index([("category", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)])
+    await db.product.create_index([("created_at", DESCENDING), ("_id", DESCENDING)])
+    # content-addressed images are released by their storage path
+    await db.image.create_index("paths.original")
+    # cart lines are looked up and upserted by (user, item_id); that index is
+    # unique and created by the unique_cart_lines migration, after the dedupe
+    # email outbox: due-message claims, and sent messages expire after a week
+    await db.email_outbox.create_index([("status", ASCENDING), ("next_attempt_at", ASCENDING)])
+    await db.email_outbox.create_index("sent_at", expireAfterSeconds=7 * 24 * 3600)
+    await db.email_outbox.create_index("failed_at", expireAfterSeconds=30 * 24 * 3600)
+
+    # stock holds: one per (user, product); the sweeper finds expired ones by expires_at.
+    # Not a TTL index: an expired hold has to give its units back before it goes.
+    await db.reservation.create_index([("user", ASCENDING), ("item_id", ASCENDING)], unique=True)
+    await db.reservation.create_index("expires_at")
+
+    # OTP codes (utils/otp.py) disappear once expired
+    await db.otp.create_index("expires_at", expireAfterSeconds=0)
+
+    # shared rate-limit windows (RATE_LIMIT_BACKEND=mongo)
+    await db.rate_limit.create_index("expires_at", expireAfterSeconds=0)
+
+    # Idempotency-Key records expire on their own
+    await db.idempotency.create_index("expires_at", expireAfterSeconds=0)
@@ -3,13 +3,41 @@ from routes import admin
 from routes.order import cart,order,wishlist
 from routes.seller import seller, seller_order,forgot_pwd_seller
 from routes.user import user_order,forgot_pwd_user,address,user
-from routes.product import category,product_up_del,product
+from routes.product import category,product_up_del,product,search,product_bulk
 from fastapi.staticfiles import StaticFiles
-from dotenv import load_dotenv
-load_dotenv()
+from db.indexes import ensure_indexes, backfill_product_timestamps, drop_legacy_otp_fields, drop_checkout_locks, unique_cart_lines, run_once
+from utils.category_registry import category_registry
+from utils import email_outbox, reservations
+from utils.security import shutdown_hash_pool
+from utils.settings import get_settings
+
+# validated while importing the routers above; missing keys never get this far
+settings = get_settings()
 
 app = FastAPI()
 
+
+@app.on_event("startup")
+async def startup():
+    await run_once("backfill_product_timestamps", backfill_product_timestamps)
+    await run_once("drop_legacy_otp_fields", drop_legacy_otp_fields)
+    await run_once("drop_checkout_locks", drop_checkout_locks)
+    await run_once("unique_cart_lines", unique_cart_lines)
+    await ensure_indexes()
+    await category_registry.load()
+    # set EMAIL_OUTBOX_WORKER=standalone when `python -m utils.email_outbox` runs separately
+    if settings.email_outbox_worker == "inprocess":
+        email_outbox.start_worker()
+    reservations.start_sweeper()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await email_outbox.stop_worker()
+    await reservations.stop_sweeper()
+    shutdown_hash_pool()
+
+
 from fastapi.middleware.cors import CORSMiddleware
 
 app.add_middleware(
@@ -35,6 +63,8 @@ app.include_router(seller.router, tags=["Seller"])
 app.include_router(forgot_pwd_seller.router, tags=["Seller"])
 app.include_router(product.router, tags=["Product"])
 app.include_router(product_up_del.router, tags=["Crud-Product"])
+app.include_router(search.router, tags=["Product"])
+app.include_router(product_bulk.router, tags=["Crud-Product"])
 app.include_router(seller_order.router, tags=["Seller-Order"])
 
 app.include_router(admin.router, tags=["Admin"])
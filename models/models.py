@@ -1,4 +1,5 @@
 from pydantic import BaseModel,EmailStr, Field
+from typing import List, Optional
 
 
 class Admin(BaseModel):
@@ -47,9 +48,37 @@ class Product(BaseModel):
     description:str
     discount:int
 
+class BulkProductRow(BaseModel):
+    name: str = Field(min_length=1)
+    price: float = Field(ge=0)
+    discount: float = Field(0, ge=0, le=100)
+    stock: int = Field(ge=0)
+    category: str
+    description: str = ""
+    # file name inside the images zip, or an http(s) URL used as-is; may be left out
+    image: Optional[str] = None
+
+class ProductBatchItem(BaseModel):
+    product_id: str
+    stock: Optional[int] = Field(None, ge=0)
+    stock_delta: Optional[int] = None
+    price: Optional[float] = Field(None, ge=0)
+    discount: Optional[float] = Field(None, ge=0, le=100)
+
+class ProductBatchUpdate(BaseModel):
+    items: List[ProductBatchItem] = Field(min_length=1, max_length=5000)
+
 class Cart(BaseModel):
     quantity:int
 
+class CartBatchItem(BaseModel):
+    product_id: str
+    quantity: int = Field(gt=0)
+
+class CartBatch(BaseModel):
+    upserts: List[CartBatchItem] = Field(default_factory=list, max_length=500)
+    remove: List[str] = Field(default_factory=list, max_length=500)
+
 class Category(BaseModel):
     category : str
 
@@ -1,18 +1,26 @@
 from models.models import AdminLogin, Admin
-from utils.security import hash_password,create_access_token,verify_password
-from utils.mail import send_otp_email,generate_otp
-from fastapi import APIRouter, HTTPException
-import os
+from utils.security import hash_password_async,create_access_token,verify_and_update_async,password_hash_stats,principal_claims
+from utils import otp
+from fastapi import APIRouter, HTTPException, Depends, Request
+from utils.security import get_current_user
+from utils.product_cache import product_cache
+from utils.principal_cache import principal_cache
+from utils.check import chk_admin
+from utils.smtp_pool import smtp_pool
+from routes.order.order import CHECKOUT_STATS, CHECKOUT_TRANSACTIONS
+from utils.reservations import RESERVATION_STATS
+from utils.settings import Settings, get_settings
+from utils import rate_limit
 from db.db import db
-from datetime import datetime, timedelta
+from datetime import datetime
 
 router = APIRouter()
 
 @router.post("/admin/register/{admin_secret}/")
-async def register_admin(admin: Admin,admin_secret:str):
+async def register_admin(admin: Admin,admin_secret:str, settings: Settings = Depends(get_settings)):
     try:
 
-        admin_secret_env = os.getenv("ADMIN_SECRET_KEY")
+        admin_secret_env = settings.admin_secret_key.get_secret_value() if settings.admin_secret_key else None
 
         if not admin_secret_env:
             raise HTTPException(
@@ -30,12 +38,7 @@ async def register_admin(admin: Admin,admin_secret:str):
         if existing:
             raise HTTPException(status_code=400, detail="Email Already Registered")
 
-        hashed_pw = hash_password(admin.password)
-
-        otp = generate_otp()
-        otp_expiry = datetime.utcnow() + timedelta(
-            minutes=int(os.getenv("OTP_EXPIRE_MINUTES", "10"))
-        )
+        hashed_pw = await hash_password_async(admin.password)
 
         doc = {
             "name": admin.name,
@@ -43,14 +46,13 @@ async def register_admin(admin: Admin,admin_secret:str):
             "password": hashed_pw,
             "role": "admin",
             "is_verified": False,
-            "email_otp": otp,
-            "email_otp_expires_at": otp_expiry,
         }
 
         res = await db.user.insert_one(doc)
         created = await db.user.find_one({"_id": res.inserted_id})
 
-        await send_otp_email(admin.email, otp)
+        # admins verify through /user/verify-otp/
+        await otp.send(otp.USER_VERIFY, admin.email)
 
         admin_data = {
             "id": str(created["_id"]),
@@ -73,11 +75,17 @@ async def register_admin(admin: Admin,admin_secret:str):
 
 
 @router.post("/admin/login/")
-async def login(usertry: AdminLogin):
+async def login(usertry: AdminLogin, request: Request):
+    await rate_limit.check("admin_login", request, usertry.email)
+
     try:
         user = await db.user.find_one({"email": usertry.email})
-        if not user or not verify_password(usertry.password, user["password"]):
+        valid, new_hash = (await verify_and_update_async(usertry.password, user["password"])) if user else (False, None)
+        if not valid:
             raise HTTPException(status_code=400, detail="Incorrect credentials-password")
+        if new_hash:
+            await db.user.update_one({"_id": user["_id"]}, {"$set": {"password": new_hash}})
+            principal_cache.invalidate(user["_id"])
 
         if not user.get("is_verified", False):
             raise HTTPException(
@@ -85,9 +93,61 @@ async def login(usertry: AdminLogin):
                 detail="Please verify your email with OTP before login",
             )
 
-        token = create_access_token({"email": usertry.email})
+        token = create_access_token(principal_claims(user))
         return {"message": "Success Login", "access_token": token, "token_type": "bearer"}
     except HTTPException:
         raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/admin/product-cache/stats/")
+async def product_cache_stats(current_user = Depends(get_current_user)):
+    await chk_admin(current_user)
+    return {"product_cache": product_cache.stats()}
+
+
+@router.get("/admin/checkout/stats/")
+async def checkout_stats(current_user = Depends(get_current_user)):
+    await chk_admin(current_user)
+    attempts = CHECKOUT_STATS["attempts"]
+    return {
+        "mode": "transaction" if CHECKOUT_TRANSACTIONS else "compensated",
+        **CHECKOUT_STATS,
+        "abort_rate": (CHECKOUT_STATS["stock_conflicts"] / attempts) if attempts else 0.0,
+        "oversold_products": await db.product.count_documents({"stock": {"$lt": 0}}),
+        "reservations": {
+            **RESERVATION_STATS,
+            "active": await db.reservation.count_documents({"expires_at": {"$gt": datetime.utcnow()}}),
+        },
+    }
+
+
+@router.get("/admin/email/stats/")
+async def email_stats(current_user = Depends(get_current_user)):
+    await chk_admin(current_user)
+    outbox = await db.email_outbox.aggregate([
+        {"$group": {"_id": "$status", "count": {"$sum": 1}}},
+    ]).to_list(length=None)
+    return {
+        "smtp": smtp_pool.stats(),
+        "outbox": {o["_id"]: o["count"] for o in outbox},
+    }
+
+
+@router.get("/admin/password-hash/stats/")
+async def password_hash_pool_stats(current_user = Depends(get_current_user)):
+    await chk_admin(current_user)
+    return password_hash_stats()
+
+
+@router.get("/admin/rate-limit/stats/")
+async def rate_limit_stats(current_user = Depends(get_current_user)):
+    await chk_admin(current_user)
+    return rate_limit.stats()
+
+
+@router.get("/admin/principal-cache/stats/")
+async def principal_cache_stats(current_user = Depends(get_current_user)):
+    await chk_admin(current_user)
+    return principal_cache.stats()
@@ -1,39 +1,55 @@
-from fastapi import APIRouter, Depends, HTTPException
-from models.models import Cart
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Header
+from models.models import Cart, CartBatch
 from utils.security import get_current_user
 from utils.check import chk_user
-from utils.utility import cart_total_save
+from utils.utility import apply_cart_delta, line_totals, verify_cart_total, clear_cart_total, cart_total_save
+from pymongo import ReturnDocument, UpdateOne, DeleteOne
+from utils.product_cache import product_cache
+from utils.idempotency import idempotent, request_fingerprint
 from db.db import db
-from bson import ObjectId
 
 router = APIRouter()
 
 @router.post("/add/item/{product_id}/")
-async def add_item(cart: Cart, product_id: str, current_user=Depends(get_current_user)):
+async def add_item(
+    cart: Cart,
+    product_id: str,
+    current_user=Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    return await idempotent(
+        idempotency_key,
+        "add_item",
+        current_user["email"],
+        request_fingerprint(product_id, cart.quantity),
+        lambda: _add_item(cart, product_id, current_user),
+    )
+
+
+async def _add_item(cart: Cart, product_id: str, current_user):
     try:
         user = await chk_user(current_user)
 
-        product = await db.product.find_one({"_id": ObjectId(product_id)})
+        product = await product_cache.get(product_id)
         if not product:
             raise HTTPException(status_code=404, detail="Product not found")
 
-        existing = await db.cart.find_one({"user": user["_id"], "item_id": product_id})
+        # one upsert changes the line and tells us what it was before
+        before = await db.cart.find_one_and_update(
+            {"user": user["_id"], "item_id": product_id},
+            {
+                "$set": {"quantity": cart.quantity},
+                "$setOnInsert": {"price": product["price"], "final_price": product["final_price"]},
+            },
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+        )
+        old_total, old_final = line_totals(before)
+        line = before or product
+        new_total, new_final = line_totals({**line, "quantity": cart.quantity})
 
-        if existing:
-            await db.cart.update_one(
-                {"user": user["_id"], "item_id": product_id},
-                {"$set": {"quantity": cart.quantity}}
-            )
-        else:
-            await db.cart.insert_one({
-                "user": user["_id"],
-                "item_id": product_id,
-                "quantity": cart.quantity,
-                "price": product["price"],
-                "final_price": product["final_price"]
-            })
-
-        total, final = await cart_total_save(user["_id"])
+        total, final = await apply_cart_delta(user["_id"], new_total - old_total, new_final - old_final)
 
         return {"msg": "Product added", "total": total, "with_discount": final}
 
@@ -45,12 +61,13 @@ async def remove_item(product_id: str, current_user=Depends(get_current_user)):
     try:
         user = await chk_user(current_user)
 
-        result = await db.cart.delete_one({"user": user["_id"], "item_id": product_id})
+        removed = await db.cart.find_one_and_delete({"user": user["_id"], "item_id": product_id})
 
-        if result.deleted_count == 0:
+        if removed is None:
             raise HTTPException(status_code=404, detail="Item not found")
 
-        total, final = await cart_total_save(user["_id"])
+        old_total, old_final = line_totals(removed)
+        total, final = await apply_cart_delta(user["_id"], -old_total, -old_final)
         return {"msg": "Item removed", "total": total, "with_discount": final}
 
     except Exception as e:
@@ -60,6 +77,7 @@ async def remove_item(product_id: str, current_user=Depends(get_current_user)):
 async def clear_cart(current_user=Depends(get_current_user)):
     user = await chk_user(current_user)
     await db.cart.delete_many({"user": user["_id"]})
+    await clear_cart_total(user["_id"])
     return {"msg": "Cart cleared"}
     
 
@@ -70,16 +88,43 @@ async def get_cart(current_user=Depends(get_current_user)):
     cursor = db.cart.find({"user": user["_id"]})
     cart = await cursor.to_list(length=None)
 
+    # every product in one $in (or straight from the cache), not one find_one per line
+    products = await product_cache.get_many(o.get("item_id") for o in cart)
+
     carts = []
+    total = 0.0
+    final = 0.0
     for o in cart:
-        product = await db.product.find_one({"_id": ObjectId(o.get("item_id"))})
+        line_total, line_final = line_totals(o)
+        total += line_total
+        final += line_final
+
+        product = products.get(str(o.get("item_id")))
+        if product is None:
+            carts.append({
+                "id": str(o["_id"]),
+                "item_id": o.get("item_id"),
+                "quantity": o.get("quantity", 0),
+                "final_price": o.get("final_price"),
+                "available": False,
+                "price_changed": False,
+            })
+            continue
+
+        current_final = product.get("final_price")
         carts.append({
             "id": str(o["_id"]),
+            "item_id": o.get("item_id"),
+            "quantity": o.get("quantity", 0),
             "product_name":product.get("name"),
             "product_price":product.get("price"),
+            "final_price": o.get("final_price"),
+            "current_final_price": current_final,
             "image_url": product.get("image_url"),
+            "thumb_url": product.get("thumb_url", product.get("image_url")),
+            "available": True,
+            "price_changed": current_final is not None and float(current_final) != float(o.get("final_price", 0)),
             })
-    total, final = await cart_total_save(user["_id"])
 
     return {
         "items": carts,
@@ -93,17 +138,18 @@ async def update_cart_quantity(product_id: str, cart: Cart, current_user=Depends
     try:
         user = await chk_user(current_user)
 
-        # Check product exists in cart
-        existing = await db.cart.find_one({"user": user["_id"], "item_id": product_id})
+        # Update only quantity; the previous line gives us the delta
+        existing = await db.cart.find_one_and_update(
+            {"user": user["_id"], "item_id": product_id},
+            {"$set": {"quantity": cart.quantity}},
+            return_document=ReturnDocument.BEFORE,
+        )
         if not existing:
             raise HTTPException(status_code=404, detail="Item Not found in cart.")
 
-        # Update only quantity
-        await db.cart.update_one(
-            {"user": user["_id"], "item_id": product_id},
-            {"$set": {"quantity": cart.quantity}}
-        )
-        total, final = await cart_total_save(user["_id"])
+        old_total, old_final = line_totals(existing)
+        new_total, new_final = line_totals({**existing, "quantity": cart.quantity})
+        total, final = await apply_cart_delta(user["_id"], new_total - old_total, new_final - old_final)
 
         return {
             "msg": "Cart updated successfully",
@@ -113,3 +159,68 @@ async def update_cart_quantity(product_id: str, cart: Cart, current_user=Depends
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/cart/verify/")
+async def verify_cart(current_user=Depends(get_current_user)):
+    """Recompute the cart totals from the lines and repair the running totals if they drifted."""
+    user = await chk_user(current_user)
+    return await verify_cart_total(user["_id"])
+
+
+@router.post("/cart/batch/")
+async def batch_update_cart(batch: CartBatch, current_user=Depends(get_current_user)):
+    """
+    Apply many cart upserts ({product_id, quantity}) and removals at once:
+    one $in to validate products, one bulk_write on db.cart, one totals recompute.
+    """
+    try:
+        user = await chk_user(current_user)
+
+        # last quantity wins for a repeated product_id
+        upserts = {it.product_id: it.quantity for it in batch.upserts}
+        removals = set(batch.remove)
+        conflicts = removals & upserts.keys()
+        if conflicts:
+            raise HTTPException(status_code=400, detail=f"Products both upserted and removed: {sorted(conflicts)}")
+
+        products = await product_cache.get_many(upserts.keys())
+
+        errors = []
+        ops = []
+        for product_id, quantity in upserts.items():
+            product = products.get(product_id)
+            if product is None:
+                errors.append({"product_id": product_id, "error": "Product not found"})
+                continue
+            ops.append(UpdateOne(
+                {"user": user["_id"], "item_id": product_id},
+                {
+                    "$set": {"quantity": quantity},
+                    "$setOnInsert": {"price": product["price"], "final_price": product["final_price"]},
+                },
+                upsert=True,
+            ))
+        for product_id in removals:
+            ops.append(DeleteOne({"user": user["_id"], "item_id": product_id}))
+
+        removed = 0
+        if ops:
+            result = await db.cart.bulk_write(ops, ordered=False)
+            removed = result.deleted_count
+
+        total, final = await cart_total_save(user["_id"])
+
+        return {
+            "msg": "Cart updated",
+            "upserted": len(upserts) - len(errors),
+            "removed": removed,
+            "errors": errors,
+            "total": total,
+            "with_discount": final,
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,17 +1,169 @@
-from fastapi import APIRouter, Depends, HTTPException
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Header
 from utils.security import get_current_user
-from db.db import db
+from db.db import db, client
 from utils.check import chk_user
 from bson import ObjectId
 from datetime import datetime
-from typing import Dict, List, Tuple
-from utils.order_email import send_order_emails  # 👈 add this
+from typing import Dict, List, Optional, Tuple
+from pymongo import UpdateOne
+from utils.order_email import build_order_emails
+from utils.email_outbox import enqueue_emails
+from utils.product_cache import product_cache
+from utils.utility import clear_cart_total
+from utils.idempotency import idempotent, request_fingerprint
+from utils import reservations
+from utils.settings import settings
 
 
 router = APIRouter()
 
+CHECKOUT_TRANSACTIONS = settings.checkout_transactions
+
+# counters for comparing the two checkout modes under load
+CHECKOUT_STATS = {
+    "attempts": 0,
+    "committed": 0,
+    "stock_conflicts": 0,
+    "transaction_runs": 0,
+}
+
+
+class _StockShortfall(Exception):
+    pass
+
+
+async def _restore_stock(items: List[Tuple[str, int]]):
+    """Compensating increments for decrements that were applied, as one bulk_write."""
+    if not items:
+        return
+    ops = [UpdateOne({"_id": ObjectId(pid_str)}, {"$inc": {"stock": qty}}) for pid_str, qty in items]
+    await db.product.bulk_write(ops, ordered=False)
+    product_cache.invalidate(*[pid for pid, _ in items])
+
+
+async def _take_stock(pid_str: str, qty: int) -> bool:
+    res = await db.product.update_one(
+        {"_id": ObjectId(pid_str), "stock": {"$gte": qty}},
+        {"$inc": {"stock": -qty}},
+    )
+    return res.modified_count == 1
+
+
+async def _decrement_stock(stock_updates: List[Tuple[str, int]]):
+    """
+    Apply every guarded decrement concurrently, one write per product. Which
+    ones applied is known from their own results, so on a shortfall exactly
+    those are compensated without marking the shared product documents.
+    """
+    if not stock_updates:
+        return
+    results = await asyncio.gather(
+        *[_take_stock(pid_str, qty) for pid_str, qty in stock_updates],
+        return_exceptions=True,
+    )
+    product_cache.invalidate(*[pid for pid, _ in stock_updates])
+
+    applied = [item for item, ok in zip(stock_updates, results) if ok is True]
+    if len(applied) == len(stock_updates):
+        return
+
+    await _restore_stock(applied)
+    error = next((r for r in results if isinstance(r, BaseException)), None)
+    if error is not None:
+        raise error
+    failed = next(pid for (pid, _), ok in zip(stock_updates, results) if ok is not True)
+    CHECKOUT_STATS["stock_conflicts"] += 1
+    raise HTTPException(
+        status_code=400,
+        detail=f"Stock issue with product {failed}"
+    )
+
+
+async def _checkout_compensated(user_id, stock_updates: List[Tuple[str, int]], order_docs: List[dict], emails: List[dict]):
+    """Default path: bulk decrement, insert_many, cart clear, undone by hand on failure."""
+    # held units are already out of stock; only the part not covered by a hold is decremented
+    held = await reservations.consume(user_id, [pid for pid, _ in stock_updates])
+    need, surplus = reservations.split_against_holds(stock_updates, held)
+    try:
+        await _decrement_stock(need)
+    except Exception:
+        # the user keeps their holds, as when the transaction path aborts
+        await reservations.restore(user_id, held)
+        raise
+    await _restore_stock(surplus)
+
+    try:
+        await db.order.insert_many(order_docs)
+    except Exception:
+        # every order has its _id up front, so partial inserts can be undone too
+        await db.order.delete_many({"_id": {"$in": [d["_id"] for d in order_docs]}})
+        await _restore_stock(stock_updates)
+        raise
+
+    # the orders exist from here on: a failure below must not turn into an error
+    # response, or a retry with the same Idempotency-Key would order again
+    try:
+        await db.cart.delete_many({"user": ObjectId(user_id)})
+        await clear_cart_total(user_id)
+    except Exception as e:
+        print("Cart clear after checkout error:", e)
+    try:
+        await enqueue_emails(emails)
+    except Exception as e:
+        print("Email outbox write error:", e)
+
+
+async def _checkout_in_transaction(user_id, stock_updates: List[Tuple[str, int]], order_docs: List[dict], emails: List[dict]):
+    """
+    Opt-in path (CHECKOUT_TRANSACTIONS=1, needs a replica set): stock, orders,
+    cart and the outbox emails change in one transaction. with_transaction
+    retries transient errors.
+    """
+    async def _txn(session):
+        CHECKOUT_STATS["transaction_runs"] += 1
+        held = await reservations.consume(user_id, [pid for pid, _ in stock_updates], session=session)
+        need, surplus = reservations.split_against_holds(stock_updates, held)
+        ops = [
+            UpdateOne({"_id": ObjectId(pid_str), "stock": {"$gte": qty}}, {"$inc": {"stock": -qty}})
+            for pid_str, qty in need
+        ]
+        ops += [UpdateOne({"_id": ObjectId(pid_str)}, {"$inc": {"stock": qty}}) for pid_str, qty in surplus]
+        if ops:
+            result = await db.product.bulk_write(ops, ordered=False, session=session)
+            if result.modified_count != len(ops):
+                raise _StockShortfall()
+        await db.order.insert_many(order_docs, session=session)
+        await db.cart.delete_many({"user": ObjectId(user_id)}, session=session)
+        await db.cart_total.delete_one({"_id": ObjectId(user_id)}, session=session)
+        await enqueue_emails(emails, session=session)
+
+    try:
+        async with await client.start_session() as session:
+            await session.with_transaction(_txn)
+    except _StockShortfall:
+        CHECKOUT_STATS["stock_conflicts"] += 1
+        raise HTTPException(status_code=400, detail="Stock issue with one or more products")
+    finally:
+        product_cache.invalidate(*[pid for pid, _ in stock_updates])
+
+
 @router.post("/create/order/")
-async def create_orders(current_user=Depends(get_current_user)):
+async def create_orders(
+    current_user=Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    # a retried checkout with the same key gets the first response back instead of ordering twice
+    return await idempotent(
+        idempotency_key,
+        "create_order",
+        current_user["email"],
+        request_fingerprint("create_order"),
+        lambda: _create_orders(current_user),
+    )
+
+
+async def _create_orders(current_user):
     try:
         user = await chk_user(current_user)
 
@@ -32,7 +184,10 @@ async def create_orders(current_user=Depends(get_current_user)):
         seller_groups: Dict[str, Dict] = {}
         stock_updates: List[Tuple[str, int]] = []
 
-        # 3) Build groups per seller & check stock
+        # 3) Build groups per seller & check stock (all products in one $in)
+        products = await product_cache.get_many(item.get("item_id") for item in cart_items)
+        # units this user holds from /checkout/start/ are already out of product.stock
+        held = await reservations.active_holds(user["_id"])
         for item in cart_items:
             pid_str = item.get("item_id")
             qty = int(item.get("quantity", 0))
@@ -40,7 +195,8 @@ async def create_orders(current_user=Depends(get_current_user)):
             if qty <= 0:
                 continue
 
-            product = await db.product.find_one({"_id": ObjectId(pid_str)})
+            # cached stock is only a pre-check; the guarded $inc below is authoritative
+            product = products.get(str(pid_str))
             if not product:
                 raise HTTPException(status_code=404, detail=f"Product {pid_str} not found")
 
@@ -50,7 +206,7 @@ async def create_orders(current_user=Depends(get_current_user)):
                 raise HTTPException(status_code=500, detail="Product missing seller info")
 
             # Stock check
-            if product.get("stock", 0) < qty:
+            if product.get("stock", 0) + held.get(str(pid_str), 0) < qty:
                 raise HTTPException(
                     status_code=400,
                     detail=f"{product.get('name', '')} insufficient stock"
@@ -88,38 +244,24 @@ async def create_orders(current_user=Depends(get_current_user)):
         if grand_final_total <= 0:
             raise HTTPException(status_code=400, detail="Invalid order amount")
 
-        # 4) Decrease stock with rollback on failure (for all products together)
-        updated_products: List[Tuple[str, int]] = []
+        quantities: Dict[str, int] = {}
         for pid_str, qty in stock_updates:
-            updated = await db.product.update_one(
-                {"_id": ObjectId(pid_str), "stock": {"$gte": qty}},
-                {"$inc": {"stock": -qty}}
-            )
-
-            if updated.modified_count == 0:
-                # rollback previous stock changes
-                for roll_pid, roll_qty in updated_products:
-                    await db.product.update_one(
-                        {"_id": ObjectId(roll_pid)},
-                        {"$inc": {"stock": roll_qty}}
-                    )
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Stock issue with product {pid_str}"
-                )
-
-            updated_products.append((pid_str, qty))
+            quantities[pid_str] = quantities.get(pid_str, 0) + qty
+        stock_updates = list(quantities.items())
 
-        # 5) Create ONE order per seller (multi-seller) with payment_pending
+        # 4) Build ONE order per seller (multi-seller) with payment_pending
         address_snapshot = {
             "mobile_no": user_address.get("mobile_no"),
             "address": user_address.get("address"),
         }
 
+        now = datetime.utcnow()
+        order_docs = []
         created_orders = []
-
         for seller_key, group in seller_groups.items():
-            order_doc = {
+            order_id = ObjectId()
+            order_docs.append({
+                "_id": order_id,
                 "user": user["_id"],
                 "seller": group["seller_id"],        # important: seller-wise order
                 "items": group["items"],
@@ -127,34 +269,43 @@ async def create_orders(current_user=Depends(get_current_user)):
                 "final_total": float(group["final_total"]),
                 "address": address_snapshot,
                 "status": "pending",
-                "created_at": datetime.utcnow(),
-            }
-
-            res = await db.order.insert_one(order_doc)
-
+                "created_at": now,
+            })
             created_orders.append({
-                "id": str(res.inserted_id),
+                "id": str(order_id),
                 "seller": seller_key,
                 "items": group["items"],
                 "total": group["total"],
                 "final_total": group["final_total"],
                 "status": "pending",
                 "address": address_snapshot,
-                "created_at": datetime.utcnow().isoformat()
+                "created_at": now.isoformat()
             })
 
-                # 6) Clear cart
-                # 6) Clear cart
-        await db.cart.delete_many({"user": ObjectId(user["_id"])})
-
-        # 7) Send emails to user + sellers (async)
-        await send_order_emails(
+        # 5) Emails to user + sellers go to the outbox with the orders; SMTP happens in the worker
+        emails = await build_order_emails(
             user=user,
             orders=created_orders,
             grand_final_total=grand_final_total,
         )
 
-        # 8) Return all seller-wise orders
+        # 6) Decrease stock, insert orders, clear the cart and queue the emails
+        CHECKOUT_STATS["attempts"] += 1
+        if CHECKOUT_TRANSACTIONS:
+            await _checkout_in_transaction(user["_id"], stock_updates, order_docs, emails)
+        else:
+            await _checkout_compensated(user["_id"], stock_updates, order_docs, emails)
+        CHECKOUT_STATS["committed"] += 1
+
+        # holds on products that left the cart go back to stock now, not at expiry
+        # (the sweeper does it later if this fails; the orders are already placed)
+        if held:
+            try:
+                await reservations.release(user["_id"])
+            except Exception as e:
+                print("Reservation release after checkout error:", e)
+
+        # 7) Return all seller-wise orders
         return {
             "msg": "Orders created",
             "orders": created_orders,
@@ -167,3 +318,56 @@ async def create_orders(current_user=Depends(get_current_user)):
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/checkout/start/")
+async def start_checkout(current_user=Depends(get_current_user)):
+    """
+    Hold stock for everything in the cart for RESERVATION_TTL_SECONDS.
+    Checkout then only drops the holds instead of racing on product.stock;
+    calling this again refreshes the holds to the current cart.
+    """
+    try:
+        user = await chk_user(current_user)
+
+        cart_items = await db.cart.find({"user": ObjectId(user["_id"])}).to_list(length=None)
+        if not cart_items:
+            raise HTTPException(status_code=400, detail="Cart is empty")
+
+        quantities: Dict[str, int] = {}
+        for item in cart_items:
+            qty = int(item.get("quantity", 0))
+            if qty > 0:
+                quantities[item["item_id"]] = quantities.get(item["item_id"], 0) + qty
+
+        held, unavailable = [], []
+        for pid_str, qty in quantities.items():
+            if await reservations.hold(user["_id"], pid_str, qty):
+                held.append({"item_id": pid_str, "quantity": qty})
+            else:
+                unavailable.append(pid_str)
+
+        return {
+            "msg": "Stock held" if not unavailable else "Some items could not be held",
+            "held": held,
+            "unavailable": unavailable,
+            "expires_in": reservations.RESERVATION_TTL_SECONDS,
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/checkout/cancel/")
+async def cancel_checkout(current_user=Depends(get_current_user)):
+    try:
+        user = await chk_user(current_user)
+        released = await reservations.release(user["_id"])
+        return {"msg": "Holds released", "released": released}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -3,6 +3,7 @@ from utils.check import chk_user
 from utils.security import get_current_user
 from db.db import db
 from bson import ObjectId
+from utils.product_cache import product_cache
 
 router = APIRouter()
 
@@ -58,10 +59,10 @@ async def get_wishlist(current_user = Depends(get_current_user)):
         if not product_ids:
             return {"msg": "Wishlist is empty", "items": []}
 
-        products = await db.product.find({"_id": {"$in": product_ids}}).to_list(length=None)
+        products = await product_cache.get_many(product_ids)
 
         items = []
-        for p in products:
+        for p in products.values():
             items.append({
                 "id": str(p["_id"]),
                 "title": p.get("title") or p.get("name"),
@@ -1,17 +1,17 @@
-from fastapi import APIRouter,Depends,HTTPException
+from fastapi import APIRouter,Depends,HTTPException,Request,Response
 from utils.security import get_current_user
+from utils.check import chk_admin
 from db.db import db
 from bson import ObjectId
 from models.models import Category
+from utils.category_registry import category_registry
 
 router = APIRouter()
 
 @router.post("/add/category/")
 async def add_category(category: Category, current_user= Depends(get_current_user)):
     try:
-        user = await db.user.find_one({"email": current_user["email"]})
-        if not user or user.get("role") != "admin":
-            raise HTTPException(status_code=400, detail="You can not perform this action")
+        await chk_admin(current_user)
         
         existing = await db.category.find_one({"category":category.category})
         if existing:
@@ -20,6 +20,7 @@ async def add_category(category: Category, current_user= Depends(get_current_use
         doc = {"category": category.category}
        
         res = await db.category.insert_one(doc)
+        await category_registry.refresh()
         created = await db.category.find_one({"_id":res.inserted_id})
         category_data = {
                 "id":str(created["_id"]),
@@ -35,9 +36,7 @@ async def add_category(category: Category, current_user= Depends(get_current_use
 @router.get("/categories/")
 async def get_all_categories(current_user=Depends(get_current_user)):
     try:
-        user = await db.user.find_one({"email": current_user["email"]})
-        if not user or user.get("role") != "admin":
-            raise HTTPException(status_code=400, detail="You can not perform this action")
+        await chk_admin(current_user)
         
         categories = await db.category.find().to_list(length=None)
 
@@ -54,12 +53,20 @@ async def get_all_categories(current_user=Depends(get_current_user)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/all/categories/")
+async def list_public_categories(request: Request, response: Response):
+    categories, etag = await category_registry.listing()
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "public, max-age=60"
+    return {"categories": categories}
+
+
 @router.put("/update/category/{category_id}/")
 async def update_category(category_id: str, category: Category, current_user = Depends(get_current_user)):
     try:
-        admin = await db.user.find_one({"email": current_user["email"]})
-        if not admin or admin.get("role") != "admin":
-            raise HTTPException(status_code=400, detail="You can not perform this action")
+        await chk_admin(current_user)
 
         existing_cat = await db.category.find_one({"_id": ObjectId(category_id)})
         if not existing_cat:
@@ -76,6 +83,7 @@ async def update_category(category_id: str, category: Category, current_user = D
             {"_id": ObjectId(category_id)},
             {"$set": {"category": category.category}}
         )
+        await category_registry.refresh()
 
         updated = await db.category.find_one({"_id": ObjectId(category_id)})
 
@@ -94,15 +102,14 @@ async def update_category(category_id: str, category: Category, current_user = D
 @router.delete("/delete/category/{category_id}/")
 async def delete_category(category_id: str, current_user = Depends(get_current_user)):
     try:
-        admin = await db.user.find_one({"email": current_user["email"]})
-        if not admin or admin.get("role") != "admin":
-            raise HTTPException(status_code=400, detail="You can not perform this action")
+        await chk_admin(current_user)
 
         existing = await db.category.find_one({"_id": ObjectId(category_id)})
         if not existing:
             raise HTTPException(status_code=404, detail="Category not found")
 
         await db.category.delete_one({"_id": ObjectId(category_id)})
+        await category_registry.refresh()
 
         return {"msg": "Category deleted successfully", "id": category_id}
 
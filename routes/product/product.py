@@ -1,9 +1,14 @@
-from uuid import uuid4
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form,Request, Query
-from db.db import db,supabase
+from typing import Optional
+from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form,Request, Query, Header
+from db.db import db
+from utils import storage, image_store
 from utils.security import get_current_user
 from utils.check import chk_seller
-from uuid import uuid4
+from utils.category_registry import category_registry
+from utils.utility import compute_final_price
+from utils.pagination import encode_cursor, decode_cursor, keyset_filter
+from utils.idempotency import idempotent, request_fingerprint
 
 router = APIRouter()
 
@@ -16,46 +21,52 @@ async def register_product(request:Request,
     category: str = Form(...),
     description: str = Form(...),
     photo: UploadFile = File(...),
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
 
 ):
+    return await idempotent(
+        idempotency_key,
+        "register_product",
+        current_user["email"],
+        request_fingerprint(name, price, discount, stock, category, description, photo.filename, photo.size),
+        lambda: _register_product(name, price, discount, stock, category, description, photo, current_user),
+    )
+
+
+async def _register_product(name, price, discount, stock, category, description, photo, current_user):
     try:
         seller = await chk_seller(current_user)
 
-        chk_category = await db.category.find_one({"category":category})
-        if not chk_category:
+        if not await category_registry.exists(category):
             raise HTTPException(status_code=400, detail="Add Avilable Category")
-        # Validate image
-        if not photo.content_type.startswith("image/"):
-            raise HTTPException(status_code=400, detail="Only image files allowed")
-
-        # Extract extension (jpg/png/webp etc.)
-        ext = photo.filename.split(".")[-1].lower()
-        file_path = f"products/{uuid4()}.{ext}" 
-        file_bytes = await photo.read()
-    # 4. upload to Supabase Storage
+        # Validate image: size-capped chunked copy, type sniffed from the bytes
+        try:
+            staged = await storage.stage_upload(photo)
+        except storage.UploadRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+    # 4. upload to Supabase Storage (deduplicated by content hash, with thumbnails)
         try:
-            upload_res = supabase.storage.from_("product-image").upload(
-                file_path,
-                file_bytes,
-                {"content-type": photo.content_type},
-            )
-        except Exception as e:
-            raise HTTPException(status_code=500, detail="Failed to upload image1")
-        if isinstance(upload_res, dict) and upload_res.get("error"):
-            raise HTTPException(status_code=500, detail="Failed to upload image2")
-      
-        image_url = supabase.storage.from_("product-image").get_public_url(file_path)
+            image = await image_store.store_image(staged)
+        except storage.StorageError:
+            raise HTTPException(status_code=500, detail="Failed to upload image")
+        finally:
+            staged.cleanup()
+
+        now = datetime.utcnow()
         product_doc = {
             "seller": seller["_id"],
             "name": name,
             "price": price,
             "discount":f"{discount}%",
-            "final_price":price-((price*discount)/100),
+            "final_price":compute_final_price(price, discount),
             "stock":stock,
             "description": description,
             "category": category,
-            "image_url": str(image_url)
+            **image,
+            "created_at": now,
+            "updated_at": now,
         }
 
         res = await db.product.insert_one(product_doc)
@@ -72,72 +83,160 @@ async def register_product(request:Request,
                 "final_price":created["final_price"],
                 "description": created["description"],
                 "category": created["category"],
-                "image_url": created["image_url"]
+                "image_url": created["image_url"],
+                "thumb_url": created["thumb_url"],
+                "medium_url": created["medium_url"],
             },
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+PRODUCT_LIST_PROJECTION = {
+    "name": 1,
+    "price": 1,
+    "final_price": 1,
+    "description": 1,
+    "category": 1,
+    "image_url": 1,
+    "thumb_url": 1,
+    "medium_url": 1,
+    "created_at": 1,
+}
+
+
+def _product_list_item(p):
+    return {
+        "id": str(p["_id"]),
+        "name": p.get("name"),
+        "price": p.get("price"),
+        "description": p.get("description"),
+        "category": p.get("category"),
+        "image_url": p.get("image_url"),
+        "thumb_url": p.get("thumb_url", p.get("image_url")),
+        "medium_url": p.get("medium_url", p.get("image_url")),
+    }
+
+
 @router.get("/products/")
-async def list_product(request:Request,current_user = Depends(get_current_user),page: int = Query(1, ge=1),size: int = Query(10, ge=1, le=50)):
+async def list_product(
+    request: Request,
+    current_user = Depends(get_current_user),
+    page: int = Query(1, ge=1),
+    size: int = Query(10, ge=1, le=50),
+    cursor: Optional[str] = Query(None),
+    category: Optional[str] = Query(None),
+    in_stock: Optional[bool] = Query(None),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+):
     try:
         seller = await chk_seller(current_user)
 
-        products = await db.product.find(
-        {"seller": seller["_id"]}
-        ).sort("created_at", -1).to_list(length=None)
-        start = (page - 1) * size
-        end = start + size
-        results = []
-        for p in products:
-            results.append({
-            "id": str(p["_id"]),
-            "name": p.get("name"),
-            "price": p.get("price"),
-            "description": p.get("description"),
-            "category":p.get("category"),
-            "image_url": p.get("image_url"),
-            })
-
-        data = results[start:end]
+        # seller equality + created_at sort is served by {seller:1, created_at:-1, _id:-1};
+        # the optional filters are applied while walking that index
+        query = {"seller": seller["_id"]}
+        if category is not None:
+            query["category"] = category
+        if in_stock is True:
+            query["stock"] = {"$gt": 0}
+        elif in_stock is False:
+            query["stock"] = {"$lte": 0}
+        if min_price is not None or max_price is not None:
+            price_range = {}
+            if min_price is not None:
+                price_range["$gte"] = min_price
+            if max_price is not None:
+                price_range["$lte"] = max_price
+            query["final_price"] = price_range
+
+        # a count over {seller} alone is answered from the index; with the other
+        # filters it would fetch every product the seller has, so it is skipped
+        total = None if len(query) > 1 else await db.product.count_documents(query)
+
+        if cursor:
+            sort_value, last_id = decode_cursor(cursor)
+            query = {"$and": [query, keyset_filter("created_at", -1, sort_value, last_id)]}
+
+        find = db.product.find(query, PRODUCT_LIST_PROJECTION).sort(
+            [("created_at", -1), ("_id", -1)]
+        )
+        if not cursor:
+            find = find.skip((page - 1) * size)
+        products = await find.limit(size + 1).to_list(length=size + 1)
+
+        next_cursor = None
+        if len(products) > size:
+            products = products[:size]
+            last = products[-1]
+            next_cursor = encode_cursor(last.get("created_at"), last["_id"])
+
         return {
-        "page": page,
+        "page": None if cursor else page,
         "size": size,
-        "total": len(results),
-        "items": data,
+        "total": total,
+        "items": [_product_list_item(p) for p in products],
+        "next_cursor": next_cursor,
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         return str(e)
     
 
+# sort option -> (field, direction); _id is always the tie-breaker
+ALL_PRODUCTS_SORTS = {
+    "newest": ("_id", -1),
+    "price_asc": ("final_price", 1),
+    "price_desc": ("final_price", -1),
+}
+
+
 @router.get("/all/products/")
-async def list_product(request:Request,page: int = Query(1, ge=1),size: int = Query(10, ge=1, le=50)):
+async def list_all_products(
+    request: Request,
+    page: int = Query(1, ge=1),
+    size: int = Query(10, ge=1, le=50),
+    sort: str = Query("newest"),
+    cursor: Optional[str] = Query(None),
+):
     try:
-        products = await db.product.find().to_list()
-        start = (page - 1) * size
-        end = start + size
-        PRODUCTS = []
-        for p in products:
-            PRODUCTS.append({
-            "id": str(p["_id"]),
-            "name": p.get("name"),
-            "price": p.get("price"),
-            "description": p.get("description"),
-            "category":p.get("category"),
-            "image_url": p.get("image_url"),
-            })
-        data = PRODUCTS[start:end]
+        if sort not in ALL_PRODUCTS_SORTS:
+            raise HTTPException(status_code=400, detail="Invalid sort option")
+        field, direction = ALL_PRODUCTS_SORTS[sort]
+
+        query = {}
+        if cursor:
+            sort_value, last_id = decode_cursor(cursor)
+            query = keyset_filter(field, direction, sort_value, last_id)
+
+        find = db.product.find(query, PRODUCT_LIST_PROJECTION).sort(
+            [(field, direction), ("_id", direction)]
+        )
+        if not cursor:
+            find = find.skip((page - 1) * size)
+        # one extra row tells us whether another page exists
+        products = await find.limit(size + 1).to_list(length=size + 1)
+
+        next_cursor = None
+        if len(products) > size:
+            products = products[:size]
+            last = products[-1]
+            next_cursor = encode_cursor(last.get(field), last["_id"])
+
         return {
-        "page": page,
-        "size": size,
-        "total": len(PRODUCTS),
-        "items": data,
+            "page": None if cursor else page,
+            "size": size,
+            "total": await db.product.estimated_document_count(),
+            "items": [_product_list_item(p) for p in products],
+            "next_cursor": next_cursor,
         }
 
+    except HTTPException:
+        raise
     except Exception as e:
         return str(e)
-    
-    
@@ -0,0 +1,330 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import zipfile
+from collections import Counter
+from datetime import datetime
+from itertools import islice
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from pydantic import ValidationError
+from bson import ObjectId
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from db.db import db
+from models.models import BulkProductRow, ProductBatchUpdate
+from utils.security import get_current_user
+from utils.check import chk_seller
+from utils.category_registry import category_registry
+from utils.utility import compute_final_price
+from utils import storage, image_store
+from utils.product_cache import product_cache
+from utils.settings import settings
+
+router = APIRouter()
+
+IMPORT_BATCH_SIZE = settings.import_batch_size
+IMPORT_IMAGE_CONCURRENCY = settings.import_image_concurrency or storage.STORAGE_MAX_CONCURRENCY
+
+
+def _detect_format(upload: UploadFile) -> str:
+    name = (upload.filename or "").lower()
+    if name.endswith(".csv") or upload.content_type == "text/csv":
+        return "csv"
+    if name.endswith((".ndjson", ".jsonl")) or upload.content_type in ("application/x-ndjson", "application/jsonl"):
+        return "ndjson"
+    raise HTTPException(status_code=400, detail="Upload a .csv or .ndjson file")
+
+
+def _iter_rows(fileobj, fmt: str):
+    """Yield (row_number, row_dict, error) from a blocking binary file, one line at a time."""
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    try:
+        if fmt == "csv":
+            # line 1 is the header
+            for n, row in enumerate(csv.DictReader(text), start=2):
+                yield n, {k.strip(): v for k, v in row.items() if k and v not in (None, "")}, None
+        else:
+            for n, line in enumerate(text, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    yield n, None, f"Invalid JSON: {e}"
+                    continue
+                if not isinstance(row, dict):
+                    yield n, None, "Row must be a JSON object"
+                    continue
+                yield n, row, None
+    finally:
+        # leave the UploadFile open for FastAPI to close
+        text.detach()
+
+
+def _open_zip(fileobj):
+    zf = zipfile.ZipFile(fileobj)
+    members = {
+        os.path.basename(info.filename): info
+        for info in zf.infolist()
+        if not info.is_dir()
+    }
+    return zf, members
+
+
+def _is_url(image: str) -> bool:
+    return image.startswith(("http://", "https://"))
+
+
+def _validation_message(e: ValidationError) -> str:
+    err = e.errors()[0]
+    field = ".".join(str(p) for p in err.get("loc", ()))
+    return f"{field}: {err.get('msg')}" if field else err.get("msg", "Invalid row")
+
+
+async def _store_images(names: Counter, zf, members) -> dict:
+    """Upload each distinct image once, taking one reference per row that uses it."""
+    results = {}
+    limit = asyncio.Semaphore(IMPORT_IMAGE_CONCURRENCY)
+
+    async def _store(name: str, refs: int):
+        async with limit:
+            try:
+                with zf.open(members[name]) as member:
+                    staged = await storage.stage_fileobj(member)
+            except storage.UploadRejected as e:
+                results[name] = e.detail
+                return
+            except Exception:
+                results[name] = "Could not read image from zip"
+                return
+            try:
+                results[name] = await image_store.store_image(staged, refs=refs)
+            except storage.StorageError:
+                results[name] = "Failed to upload image"
+            finally:
+                staged.cleanup()
+
+    await asyncio.gather(*[_store(name, refs) for name, refs in names.items()])
+    return results
+
+
+async def _import_batch(rows, seller, zf, members, errors: list) -> int:
+    valid = []
+    for n, row, err in rows:
+        if err:
+            errors.append({"row": n, "error": err})
+            continue
+        try:
+            item = BulkProductRow.model_validate(row)
+        except ValidationError as e:
+            errors.append({"row": n, "error": _validation_message(e)})
+            continue
+        if not await category_registry.exists(item.category):
+            errors.append({"row": n, "error": "Add Avilable Category"})
+            continue
+        if item.image and not _is_url(item.image) and item.image not in members:
+            detail = "not found in zip" if zf is not None else "needs an images zip"
+            errors.append({"row": n, "error": f"Image {item.image} {detail}"})
+            continue
+        valid.append((n, item))
+
+    if not valid:
+        return 0
+
+    zipped = Counter(item.image for _, item in valid if item.image and not _is_url(item.image))
+    images = await _store_images(zipped, zf, members) if zipped else {}
+
+    now = datetime.utcnow()
+    docs = []
+    doc_rows = []
+    for n, item in valid:
+        if not item.image:
+            image = {}
+        elif _is_url(item.image):
+            # external images are linked, not copied; there are no derivatives
+            image = {"image_url": item.image, "thumb_url": item.image, "medium_url": item.image}
+        else:
+            image = images.get(item.image)
+            if not isinstance(image, dict):
+                errors.append({"row": n, "error": image or "Failed to upload image"})
+                continue
+        docs.append({
+            "seller": seller["_id"],
+            "name": item.name,
+            "price": item.price,
+            "discount": f"{item.discount}%",
+            "final_price": compute_final_price(item.price, item.discount),
+            "stock": item.stock,
+            "description": item.description,
+            "category": item.category,
+            **image,
+            "created_at": now,
+            "updated_at": now,
+        })
+        doc_rows.append((n, image.get("image_hash")))
+
+    if not docs:
+        return 0
+
+    inserted = len(docs)
+    try:
+        await db.product.bulk_write([InsertOne(d) for d in docs], ordered=False)
+    except BulkWriteError as e:
+        write_errors = e.details.get("writeErrors", [])
+        inserted -= len(write_errors)
+        for we in write_errors:
+            n, image_hash = doc_rows[we["index"]]
+            errors.append({"row": n, "error": we.get("errmsg", "Insert failed")})
+            if image_hash:
+                await image_store.release_hash(image_hash)
+    return inserted
+
+
+@router.post("/product/bulk/import/")
+async def bulk_import_products(
+    file: UploadFile = File(...),
+    images: Optional[UploadFile] = File(None),
+    current_user = Depends(get_current_user),
+):
+    """
+    Import a CSV/NDJSON catalog (name, price, discount, stock, category,
+    description, image). `image` is a file name in the optional images zip,
+    an http(s) URL, or empty.
+    Rows are processed IMPORT_BATCH_SIZE at a time; each batch is one bulk_write.
+    """
+    try:
+        seller = await chk_seller(current_user)
+        fmt = _detect_format(file)
+
+        loop = asyncio.get_running_loop()
+        zf, members = None, {}
+        if images is not None:
+            try:
+                zf, members = await loop.run_in_executor(None, _open_zip, images.file)
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail="Images must be a zip file")
+
+        rows = _iter_rows(file.file, fmt)
+        errors = []
+        inserted = 0
+        total = 0
+        try:
+            while True:
+                batch = await loop.run_in_executor(None, lambda: list(islice(rows, IMPORT_BATCH_SIZE)))
+                if not batch:
+                    break
+                total += len(batch)
+                inserted += await _import_batch(batch, seller, zf, members, errors)
+        finally:
+            rows.close()
+            if zf is not None:
+                zf.close()
+
+        errors.sort(key=lambda e: e["row"])
+        return {
+            "msg": "Import finished",
+            "rows": total,
+            "inserted": inserted,
+            "failed": len(errors),
+            "errors": errors,
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/product/batch/update/")
+async def batch_update_products(batch: ProductBatchUpdate, current_user = Depends(get_current_user)):
+    """
+    Apply many stock/price/discount changes in one ordered bulk_write.
+    `stock` sets an absolute value, `stock_delta` adjusts it (never below 0).
+    """
+    try:
+        seller = await chk_seller(current_user)
+
+        ids = {it.product_id for it in batch.items if ObjectId.is_valid(it.product_id)}
+        owned = await db.product.find(
+            {"_id": {"$in": [ObjectId(pid) for pid in ids]}, "seller": seller["_id"]},
+            {"price": 1, "discount": 1},
+        ).to_list(length=None)
+        # running price/discount per product so repeated ids see earlier changes
+        state = {str(p["_id"]): {"price": p.get("price", 0.0), "discount": p.get("discount", "0")} for p in owned}
+
+        results = [None] * len(batch.items)
+        ops = []
+        op_index = []
+        now = datetime.utcnow()
+        for i, it in enumerate(batch.items):
+            current = state.get(it.product_id)
+            if current is None:
+                results[i] = {"product_id": it.product_id, "status": "error", "error": "Product not found"}
+                continue
+            if it.stock is not None and it.stock_delta is not None:
+                results[i] = {"product_id": it.product_id, "status": "error", "error": "Send either stock or stock_delta"}
+                continue
+            if it.stock is None and it.stock_delta is None and it.price is None and it.discount is None:
+                results[i] = {"product_id": it.product_id, "status": "error", "error": "Nothing to update"}
+                continue
+
+            fields = {"updated_at": now}
+            if it.stock is not None:
+                fields["stock"] = it.stock
+            if it.price is not None:
+                current["price"] = it.price
+                fields["price"] = it.price
+            if it.discount is not None:
+                current["discount"] = f"{it.discount}%"
+                fields["discount"] = current["discount"]
+            if it.price is not None or it.discount is not None:
+                fields["final_price"] = compute_final_price(current["price"], current["discount"])
+
+            if it.stock_delta is not None:
+                # pipeline update so the delta is clamped at 0 without a guard that could miss
+                update = [{"$set": {
+                    **fields,
+                    "stock": {"$max": [0, {"$add": [{"$ifNull": ["$stock", 0]}, it.stock_delta]}]},
+                }}]
+            else:
+                update = {"$set": fields}
+            ops.append(UpdateOne({"_id": ObjectId(it.product_id)}, update))
+            op_index.append(i)
+
+        failed_at = None
+        error = None
+        if ops:
+            try:
+                await db.product.bulk_write(ops, ordered=True)
+            except BulkWriteError as e:
+                # ordered: everything before the first error applied, nothing after it
+                first = e.details.get("writeErrors", [{}])[0]
+                failed_at = first.get("index", 0)
+                error = first.get("errmsg", "Update failed")
+
+        for n, i in enumerate(op_index):
+            pid = batch.items[i].product_id
+            if failed_at is None or n < failed_at:
+                results[i] = {"product_id": pid, "status": "updated"}
+            elif n == failed_at:
+                results[i] = {"product_id": pid, "status": "error", "error": error}
+            else:
+                results[i] = {"product_id": pid, "status": "skipped", "error": "Not applied after an earlier failure"}
+
+        product_cache.invalidate(*[batch.items[i].product_id for i in op_index])
+
+        return {
+            "msg": "Batch processed",
+            "updated": sum(1 for r in results if r["status"] == "updated"),
+            "results": results,
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,11 +1,15 @@
 import os
-from uuid import uuid4
 from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form,Request
-from db.db import db, supabase, SUPABASE_URL
+from db.db import db, SUPABASE_URL
+from utils import storage, image_store
 from utils.security import get_current_user
 from utils.check import chk_seller
 from typing import Optional
 from bson import ObjectId
+from datetime import datetime
+from utils.product_cache import product_cache
+from utils.category_registry import category_registry
+from utils.utility import compute_final_price
 
 router = APIRouter()
 
@@ -17,7 +21,7 @@ def _get_file_path_from_url(image_url: str) -> Optional[str]:
     https://<project>.supabase.co/storage/v1/object/public/<bucket>/products/abc.png
     """
     # Standard public URL prefix
-    prefix = f"{SUPABASE_URL}/storage/v1/object/public/product-image/"
+    prefix = f"{SUPABASE_URL}/storage/v1/object/public/{storage.BUCKET}/"
     if image_url.startswith(prefix):
         return image_url[len(prefix):]
     # If for some reason you saved only path, just return it
@@ -62,67 +66,43 @@ async def update_product(
         if description is not None:
             update_fields["description"] = description
         if category is not None:
-            chk_category = await db.category.find_one({"category":category})
-            if not chk_category:
+            if not await category_registry.exists(category):
                 raise HTTPException(status_code=400, detail="Add Avilable Category")
             update_fields["category"] = category
 
         if photo is not None:
-            if not (photo.content_type and photo.content_type.startswith("image/")):
-                raise HTTPException(status_code=400, detail="Only image files allowed for photo")
-
-            # 1. delete old image from Supabase (if exists)
-            old_image_url = product.get("image_url")
-            if old_image_url:
-                await _delete_image_from_supabase(old_image_url)
-
-            # 2. upload new image
-            ext = photo.filename.split(".")[-1].lower()
-            file_path = f"products/{uuid4()}.{ext}"
-            file_bytes = await photo.read()
+            try:
+                staged = await storage.stage_upload(photo)
+            except storage.UploadRejected as e:
+                raise HTTPException(status_code=e.status_code, detail=e.detail)
 
+            # 1. upload new image (or take a reference on an identical one)
             try:
-                upload_res = supabase.storage.from_("product-image").upload(
-                    file_path,
-                    file_bytes,
-                    {"content-type": photo.content_type},
-                )
-            except Exception as e:
+                image = await image_store.store_image(staged)
+            except storage.StorageError:
                 raise HTTPException(status_code=500, detail="Failed to upload image")
+            finally:
+                staged.cleanup()
 
-            if isinstance(upload_res, dict) and upload_res.get("error"):
-                raise HTTPException(status_code=500, detail="Failed to upload image")
+            update_fields.update(image)
 
-            image_url = supabase.storage.from_("product-image").get_public_url(file_path)
-            update_fields["image_url"] = str(image_url)
+            # 2. release old image (if exists), only once the new one is stored
+            old_image_url = product.get("image_url")
+            if old_image_url:
+                await _delete_image_from_supabase(old_image_url)
 
 
         # if price or discount changed (or both), recalc final_price
         # Use updated values if present, otherwise fall back to existing product values
         new_price = update_fields.get("price", product.get("price", 0.0))
-        # parse discount value: stored as "10%" in DB
-        if "discount" in update_fields:
-            # update_fields["discount"] is like "10%"
-            try:
-                disc_val = float(str(update_fields["discount"]).rstrip("%"))
-            except Exception:
-                disc_val = 0.0
-        else:
-            # get existing discount string like "10%" => parse number
-            try:
-                disc_val = float(str(product.get("discount", "0")).rstrip("%"))
-            except Exception:
-                disc_val = 0.0
-
-        try:
-            final_price = float(new_price) - ((float(new_price) * float(disc_val)) / 100.0)
-        except Exception:
-            final_price = float(new_price)
-
-        update_fields["final_price"] = final_price
+        # discount is stored as "10%" in DB
+        new_discount = update_fields.get("discount", product.get("discount", "0"))
+        update_fields["final_price"] = compute_final_price(new_price, new_discount)
+        update_fields["updated_at"] = datetime.utcnow()
 
         if update_fields:
             await db.product.update_one({"_id": ObjectId(product_id)}, {"$set": update_fields})
+            product_cache.invalidate(product_id)
 
         updated = await db.product.find_one({"_id": ObjectId(product_id)})
 
@@ -137,17 +117,21 @@ async def update_product(
                 "final_price": updated.get("final_price"),
                 "description": updated.get("description"),
                 "category": updated.get("category"),
-                "image_url": updated.get("image_url")
+                "image_url": updated.get("image_url"),
+                "thumb_url": updated.get("thumb_url"),
+                "medium_url": updated.get("medium_url"),
             }
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 
 async def _delete_image_from_supabase(image_url: str):
-    """Delete a single image from Supabase Storage if possible."""
+    """Release one reference to an image; storage objects go when the last reference does."""
     if not image_url:
         return
 
@@ -156,9 +140,8 @@ async def _delete_image_from_supabase(image_url: str):
         return  # can't parse path, silently ignore
 
     try:
-        res = supabase.storage.from_("product-image").remove([file_path])
-        # Optional: check res for error depending on supabase-py version
-    except Exception as e:
+        await image_store.release_image(file_path)
+    except storage.StorageError as e:
         print("Supabase delete error:", e)
 
 
@@ -181,6 +164,7 @@ async def delete_product(product_id: str, current_user=Depends(get_current_user)
 
         # 2. delete product from MongoDB
         await db.product.delete_one({"_id": ObjectId(product_id)})
+        product_cache.invalidate(product_id)
 
         return {"msg": "Product deleted successfully"}
 
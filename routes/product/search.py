@@ -0,0 +1,181 @@
+import asyncio
+import time
+from typing import Dict, Optional
+from fastapi import APIRouter, HTTPException, Query
+from db.db import db
+from utils.settings import settings
+
+router = APIRouter()
+
+PRICE_BUCKETS = [0, 500, 1000, 2500, 5000, 10000, 50000]
+# open-ended top bucket, so $bucket's default only collects products without a usable price
+_BUCKET_BOUNDARIES = PRICE_BUCKETS + [float("inf")]
+UNPRICED_BUCKET = "unpriced"
+
+SEARCH_SORTS = {
+    "price_asc": {"final_price": 1, "_id": 1},
+    "price_desc": {"final_price": -1, "_id": -1},
+    "newest": {"created_at": -1, "_id": -1},
+}
+
+# unfiltered browse facets cover the whole catalog, so they are computed at most
+# this often per worker instead of on every request
+SEARCH_FACET_CACHE_SECONDS = settings.search_facet_cache_seconds
+_browse_facets: Dict[bool, tuple] = {}
+_browse_lock = asyncio.Lock()
+
+SEARCH_PROJECTION = {
+    "name": 1,
+    "price": 1,
+    "final_price": 1,
+    "description": 1,
+    "category": 1,
+    "stock": 1,
+    "image_url": 1,
+    "thumb_url": 1,
+    "medium_url": 1,
+}
+
+
+FACET_STAGES = {
+    "total": [{"$count": "count"}],
+    "categories": [{"$sortByCount": "$category"}],
+    "price_buckets": [{"$bucket": {
+        "groupBy": "$final_price",
+        "boundaries": _BUCKET_BOUNDARIES,
+        "default": UNPRICED_BUCKET,
+        "output": {"count": {"$sum": 1}},
+    }}],
+}
+
+
+async def _cached_browse_facets(match: dict) -> dict:
+    """Facets for an unfiltered browse (optionally in-stock only), refreshed every SEARCH_FACET_CACHE_SECONDS."""
+    key = "stock" in match
+    cached = _browse_facets.get(key)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    async with _browse_lock:
+        # another request may have refreshed it while we waited
+        cached = _browse_facets.get(key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        result = await db.product.aggregate(
+            [{"$match": match}, {"$facet": FACET_STAGES}], allowDiskUse=True
+        ).to_list(length=1)
+        facets = result[0] if result else {}
+        _browse_facets[key] = (time.monotonic() + SEARCH_FACET_CACHE_SECONDS, facets)
+        return facets
+
+
+@router.get("/search/products/")
+async def search_products(
+    q: Optional[str] = Query(None, min_length=1),
+    category: Optional[str] = Query(None),
+    min_price: Optional[float] = Query(None, ge=0),
+    max_price: Optional[float] = Query(None, ge=0),
+    in_stock: bool = Query(False),
+    sort: str = Query("relevance"),
+    page: int = Query(1, ge=1),
+    size: int = Query(10, ge=1, le=50),
+):
+    try:
+        if sort != "relevance" and sort not in SEARCH_SORTS:
+            raise HTTPException(status_code=400, detail="Invalid sort option")
+
+        match = {}
+        if q:
+            match["$text"] = {"$search": q}
+        if category is not None:
+            match["category"] = category
+        if min_price is not None or max_price is not None:
+            price_range = {}
+            if min_price is not None:
+                price_range["$gte"] = min_price
+            if max_price is not None:
+                price_range["$lte"] = max_price
+            match["final_price"] = price_range
+        if in_stock:
+            match["stock"] = {"$gt": 0}
+
+        projection = dict(SEARCH_PROJECTION)
+        if q and sort == "relevance":
+            projection["score"] = {"$meta": "textScore"}
+            sort_stage = {"score": {"$meta": "textScore"}, "_id": -1}
+        else:
+            # relevance without a text query falls back to recency
+            sort_stage = SEARCH_SORTS.get(sort, SEARCH_SORTS["newest"])
+
+        if set(match) <= {"stock"}:
+            # browse: page straight off the sort index, catalog-wide facets from the cache
+            items_cursor = db.product.find(match, projection).sort(list(sort_stage.items()))
+            page_items = await items_cursor.skip((page - 1) * size).limit(size).to_list(length=size)
+            facets = {"items": page_items, **await _cached_browse_facets(match)}
+        else:
+            # sort before $facet so it can use an index; the count facets ignore order
+            pipeline = [
+                {"$match": match},
+                {"$sort": sort_stage},
+                {"$facet": {
+                    "items": [
+                        {"$skip": (page - 1) * size},
+                        {"$limit": size},
+                        {"$project": projection},
+                    ],
+                    **FACET_STAGES,
+                }},
+            ]
+            result = await db.product.aggregate(pipeline).to_list(length=1)
+            facets = result[0] if result else {}
+
+        items = []
+        for p in facets.get("items", []):
+            item = {
+                "id": str(p["_id"]),
+                "name": p.get("name"),
+                "price": p.get("price"),
+                "final_price": p.get("final_price"),
+                "description": p.get("description"),
+                "category": p.get("category"),
+                "in_stock": p.get("stock", 0) > 0,
+                "image_url": p.get("image_url"),
+                "thumb_url": p.get("thumb_url", p.get("image_url")),
+                "medium_url": p.get("medium_url", p.get("image_url")),
+            }
+            if "score" in p:
+                item["score"] = p["score"]
+            items.append(item)
+
+        price_buckets = []
+        for b in facets.get("price_buckets", []):
+            if b["_id"] == UNPRICED_BUCKET:
+                price_buckets.append({"label": UNPRICED_BUCKET, "min": None, "max": None, "count": b["count"]})
+                continue
+            idx = _BUCKET_BOUNDARIES.index(b["_id"])
+            upper = _BUCKET_BOUNDARIES[idx + 1]
+            price_buckets.append({
+                "min": b["_id"],
+                "max": None if upper == float("inf") else upper,
+                "count": b["count"],
+            })
+
+        total = facets.get("total") or [{"count": 0}]
+
+        return {
+            "page": page,
+            "size": size,
+            "total": total[0]["count"],
+            "items": items,
+            "facets": {
+                "categories": [
+                    {"category": c["_id"], "count": c["count"]}
+                    for c in facets.get("categories", [])
+                ],
+                "price_buckets": price_buckets,
+            },
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,12 +1,13 @@
-from fastapi import APIRouter, HTTPException, Form
-from datetime import datetime, timedelta
+from fastapi import APIRouter, HTTPException, Form, Request
 from models.models import SellerVerifyOTP , Seller, SellerLogin
-from utils.security import hash_password, create_access_token, verify_password
-from utils.mail import generate_otp, send_otp_email
+from utils.security import hash_password_async, create_access_token, verify_and_update_async, principal_claims
+from utils.principal_cache import principal_cache
+from utils import otp
 from pydantic import EmailStr
 from typing import Optional
 from db.db import db
-import os  
+from pymongo import ReturnDocument
+from utils import rate_limit
 
 router = APIRouter()
 
@@ -17,9 +18,7 @@ async def register(user: Seller):
         if existing:
             raise HTTPException(status_code=400, detail="Email Already Registered")
 
-        hashed_pw = hash_password(user.password)
-        otp = generate_otp()
-        otp_expiry = datetime.utcnow() + timedelta(minutes=int(os.getenv("OTP_EXPIRE_MINUTES")))
+        hashed_pw = await hash_password_async(user.password)
 
         doc = {
             "business_name": user.business_name,
@@ -28,15 +27,13 @@ async def register(user: Seller):
             "password": hashed_pw,
             "role": "seller",
             "is_verified": False,
-            "email_otp": otp,
-            "email_otp_expires_at": otp_expiry,
         }
 
         res = await db.seller.insert_one(doc)
         created = await db.seller.find_one({"_id": res.inserted_id})
 
         # send OTP to seller email
-        await send_otp_email(user.email, otp)  # this uses your real email logic
+        await otp.send(otp.SELLER_VERIFY, user.email)
 
         user_data = {
             "id": str(created["_id"]),
@@ -58,35 +55,31 @@ async def register(user: Seller):
 
 
 @router.post("/seller/verify-otp/")
-async def verify_seller_otp(data: SellerVerifyOTP):
+async def verify_seller_otp(data: SellerVerifyOTP, request: Request):
+    await rate_limit.check("seller_verify_otp", request, data.email)
+
     try:
-        user = await db.seller.find_one({"email": data.email})
+        # the code is checked and consumed in one step; the account is only read to explain a failure
+        if not await otp.verify(otp.SELLER_VERIFY, data.email, data.otp):
+            user = await db.seller.find_one({"email": data.email}, {"is_verified": 1})
+            if not user:
+                raise HTTPException(status_code=404, detail="Seller not found")
+            if user.get("is_verified"):
+                return {"message": "Seller email already verified"}
+            raise HTTPException(status_code=400, detail="Invalid or expired OTP")
+
+        # mark as verified
+        user = await db.seller.find_one_and_update(
+            {"email": data.email},
+            {"$set": {"is_verified": True}},
+            return_document=ReturnDocument.AFTER,
+        )
         if not user:
             raise HTTPException(status_code=404, detail="Seller not found")
-
-        if user.get("is_verified"):
-            return {"message": "Seller email already verified"}
-
-        # check OTP
-        if user.get("email_otp") != data.otp:
-            raise HTTPException(status_code=400, detail="Invalid OTP")
-
-        # check expiry
-        expires_at = user.get("email_otp_expires_at")
-        if not expires_at or expires_at < datetime.utcnow():
-            raise HTTPException(status_code=400, detail="OTP expired")
-
-        # mark as verified & clear OTP
-        await db.seller.update_one(
-            {"_id": user["_id"]},
-            {
-                "$set": {"is_verified": True},
-                "$unset": {"email_otp": "", "email_otp_expires_at": ""},
-            },
-        )
+        principal_cache.invalidate(user["_id"])
 
         # give token after successful verification
-        access_token = create_access_token({"email": data.email})
+        access_token = create_access_token(principal_claims(user))
 
         return {
             "message": "Seller email verified successfully",
@@ -103,28 +96,16 @@ async def verify_seller_otp(data: SellerVerifyOTP):
 @router.post("/seller/resend/otp/")
 async def seller_resend_otp(email: Optional[EmailStr] = Form(...)):
     try:
-        existing = await db.seller.find_one({"email": email})
+        created = await db.seller.find_one({"email": email}, {"business_name": 1, "email": 1, "is_verified": 1})
 
-        if not existing:
+        if not created:
             raise HTTPException(status_code=400,detail="Email Not Registered")
         
-        if existing["is_verified"] == True:
+        if created["is_verified"] == True:
             raise HTTPException(status_code=400, detail="Email Already Verified")
 
-        otp = generate_otp()
-        otp_expiry = datetime.utcnow() + timedelta(minutes=int(os.getenv("OTP_EXPIRE_MINUTES")))
-        doc = {
-            "is_verified": False,
-            "email_otp": otp,
-            "email_otp_expires_at": otp_expiry,
-        }
-
-        await db.seller.update_one({"email": email}, {"$set": doc})
-        created = await db.seller.find_one({"email": email})
-
-
-        # send OTP to email
-        await send_otp_email(email, otp)
+        # send OTP to email (429 inside the resend cooldown)
+        await otp.send(otp.SELLER_VERIFY, email)
 
         user_data = {
             "id": str(created["_id"]),
@@ -137,17 +118,25 @@ async def seller_resend_otp(email: Optional[EmailStr] = Form(...)):
             "msg": "registered, OTP sent to your email",
             "user": user_data,
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
     
 
 
 @router.post("/seller/login/")
-async def login(usertry: SellerLogin):
+async def login(usertry: SellerLogin, request: Request):
+    await rate_limit.check("seller_login", request, usertry.email)
+
     try:
         user = await db.seller.find_one({"email": usertry.email})
-        if not user or not verify_password(usertry.password, user["password"]):
+        valid, new_hash = (await verify_and_update_async(usertry.password, user["password"])) if user else (False, None)
+        if not valid:
             raise HTTPException(status_code=400, detail="Incorrect credentials-password")
+        if new_hash:
+            await db.seller.update_one({"_id": user["_id"]}, {"$set": {"password": new_hash}})
+            principal_cache.invalidate(user["_id"])
 
         if not user.get("is_verified", False):
             raise HTTPException(
@@ -155,7 +144,7 @@ async def login(usertry: SellerLogin):
                 detail="Please verify your email with OTP before login",
             )
 
-        token = create_access_token({"email": usertry.email})
+        token = create_access_token(principal_claims(user))
         return {"message": "Success Login", "access_token": token, "token_type": "bearer"}
     except HTTPException:
         raise
@@ -4,6 +4,7 @@ from utils.check import chk_seller
 from db.db import db
 from bson import ObjectId
 from datetime import datetime
+from utils.product_cache import product_cache
 
 router = APIRouter()
 
@@ -52,12 +53,11 @@ async def _check_seller_owns_order(order, seller):
     if not item_ids:
         raise HTTPException(status_code=400, detail="Order has no items")
  
-    products = await db.product.find({"_id": {"$in": item_ids}}).to_list(length=None)
-    product_map = {p["_id"]: p for p in products}
+    product_map = await product_cache.get_many(item_ids)
 
     for it in order.get("items", []):
         pid = ObjectId(it["item_id"])
-        product = product_map.get(pid)
+        product = product_map.get(str(pid))
 
         if not product:
             raise HTTPException(status_code=404, detail=f"Product {pid} not found for this order")
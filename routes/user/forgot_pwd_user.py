@@ -1,17 +1,18 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
 from models.models import ForgotPasswordRequest, ResetPasswordWithOTP
-from datetime import datetime, timedelta
-from utils.mail import send_otp_email,generate_otp
+from utils import otp
 from db.db import db
-from utils.security import hash_password, create_access_token
-import os
+from pymongo import ReturnDocument
+from utils.security import hash_password_async, create_access_token, principal_claims
+from utils.principal_cache import principal_cache
+from utils import rate_limit
 
 router = APIRouter()
 
 @router.post("/user/forgot-password/request/")
 async def forgot_password_request(payload: ForgotPasswordRequest):
     try:
-        user = await db.user.find_one({"email": payload.email})
+        user = await db.user.find_one({"email": payload.email}, {"is_verified": 1})
         if not user:
             # same behavior style as resend_otp
             raise HTTPException(status_code=400, detail="Email not registered")
@@ -19,22 +20,8 @@ async def forgot_password_request(payload: ForgotPasswordRequest):
         if not user.get("is_verified"):
             raise HTTPException(status_code=400, detail="Email not verified")
 
-        otp = generate_otp()
-        otp_expiry = datetime.utcnow() + timedelta(
-            minutes=int(os.getenv("OTP_EXPIRE_MINUTES", "10"))
-        )
-        await db.user.update_one(
-            {"_id": user["_id"]},
-            {
-                "$set": {
-                    "reset_otp": otp,
-                    "reset_otp_expires_at": otp_expiry,
-                }
-            },
-        )
-
-        # send OTP to email
-        await send_otp_email(payload.email, otp)
+        # send OTP to email (429 inside the resend cooldown)
+        await otp.send(otp.USER_RESET, payload.email)
 
         return {
             "msg": "Password reset OTP sent to your email",
@@ -47,41 +34,32 @@ async def forgot_password_request(payload: ForgotPasswordRequest):
 
 
 @router.post("/user/forgot-password/verify/")
-async def forgot_password_verify(payload: ResetPasswordWithOTP):
-    try:
-        user = await db.user.find_one({"email": payload.email})
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
+async def forgot_password_verify(payload: ResetPasswordWithOTP, request: Request):
+    await rate_limit.check("user_reset_verify", request, payload.email)
 
-        if not user.get("is_verified"):
-            raise HTTPException(status_code=400, detail="Email not verified")
-
-        # check reset OTP
-        if user.get("reset_otp") != payload.otp:
-            raise HTTPException(status_code=400, detail="Invalid OTP...")
-
-        # check expiry
-        expires_at = user.get("reset_otp_expires_at")
-        if not expires_at or expires_at < datetime.utcnow():
-            raise HTTPException(status_code=400, detail="OTP expired...")
+    try:
+        # reset codes are only issued to verified accounts; checked and consumed in one step
+        if not await otp.verify(otp.USER_RESET, payload.email, payload.otp):
+            raise HTTPException(status_code=400, detail="Invalid or expired OTP")
 
         # hash new password
-        new_hashed_pw = hash_password(payload.new_password)
+        new_hashed_pw = await hash_password_async(payload.new_password)
 
-        # update password and clear reset fields
-        await db.user.update_one(
-            {"_id": user["_id"]},
+        # update password and revoke every token issued before now
+        user = await db.user.find_one_and_update(
+            {"email": payload.email},
             {
                 "$set": {"password": new_hashed_pw},
-                "$unset": {
-                    "reset_otp": "",
-                    "reset_otp_expires_at": "",
-                },
+                "$inc": {"token_version": 1},
             },
+            return_document=ReturnDocument.AFTER,
         )
+        if not user:
+            raise HTTPException(status_code=404, detail="User not found")
+        principal_cache.invalidate(user["_id"])
 
         # optional: give token immediately after reset
-        access_token = create_access_token({"email": payload.email})
+        access_token = create_access_token(principal_claims(user))
 
         return {
             "msg": "Password reset successfully",
@@ -1,13 +1,14 @@
-from fastapi import APIRouter,Depends, HTTPException, Form
+from fastapi import APIRouter,Depends, HTTPException, Form, Request
 from models.models import UserLogin,User,VerifyOTP
-from datetime import datetime, timedelta
-from utils.mail import send_otp_email,generate_otp
+from utils import otp
 from utils.check import chk_user
 from db.db import db
+from pymongo import ReturnDocument
 from pydantic import EmailStr
 from typing import Optional
-from utils.security import hash_password, verify_password, create_access_token, get_current_user
-import os
+from utils.security import hash_password_async, verify_and_update_async, create_access_token, get_current_user, principal_claims
+from utils.principal_cache import principal_cache
+from utils import rate_limit
 
 router = APIRouter()
 
@@ -18,9 +19,7 @@ async def register(user: User):
         if existing:
             raise HTTPException(status_code=400, detail="Email Already Registered")
 
-        hashed_pw = hash_password(user.password)
-        otp = generate_otp()
-        otp_expiry = datetime.utcnow() + timedelta(minutes=int(os.getenv("OTP_EXPIRE_MINUTES")))
+        hashed_pw = await hash_password_async(user.password)
 
         doc = {
             "name": user.name,
@@ -28,8 +27,6 @@ async def register(user: User):
             "password": hashed_pw,
             "role": "user",
             "is_verified": False,
-            "email_otp": otp,
-            "email_otp_expires_at": otp_expiry,
         }
 
     
@@ -39,7 +36,7 @@ async def register(user: User):
     
 
         # send OTP to email
-        await send_otp_email(user.email, otp)
+        await otp.send(otp.USER_VERIFY, user.email)
 
         user_data = {
             "id": str(created["_id"]),
@@ -61,35 +58,31 @@ async def register(user: User):
 
 
 @router.post("/user/verify-otp/")
-async def verify_otp(data: VerifyOTP):
+async def verify_otp(data: VerifyOTP, request: Request):
+    await rate_limit.check("user_verify_otp", request, data.email)
+
     try:
-        user = await db.user.find_one({"email": data.email})
+        # the code is checked and consumed in one step; the account is only read to explain a failure
+        if not await otp.verify(otp.USER_VERIFY, data.email, data.otp):
+            user = await db.user.find_one({"email": data.email}, {"is_verified": 1})
+            if not user:
+                raise HTTPException(status_code=404, detail="User not found")
+            if user.get("is_verified"):
+                return {"message": "Email already verified"}
+            raise HTTPException(status_code=400, detail="Invalid or expired OTP")
+
+        # mark as verified
+        user = await db.user.find_one_and_update(
+            {"email": data.email},
+            {"$set": {"is_verified": True}},
+            return_document=ReturnDocument.AFTER,
+        )
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
-
-        if user.get("is_verified"):
-            return {"message": "Email already verified"}
-
-        # check OTP
-        if user.get("email_otp") != data.otp:
-            raise HTTPException(status_code=400, detail="Invalid OTP")
-
-        # check expiry
-        expires_at = user.get("email_otp_expires_at")
-        if not expires_at or expires_at < datetime.utcnow():
-            raise HTTPException(status_code=400, detail="OTP expired")
-
-        # mark as verified and clear OTP fields
-        await db.user.update_one(
-            {"_id": user["_id"]},
-            {
-                "$set": {"is_verified": True},
-                "$unset": {"email_otp": "", "email_otp_expires_at": ""},
-            },
-        )
+        principal_cache.invalidate(user["_id"])
 
         # optional: give token after successful verification
-        access_token = create_access_token({"email": data.email})
+        access_token = create_access_token(principal_claims(user))
 
         return {
             "message": "Email verified successfully",
@@ -105,28 +98,16 @@ async def verify_otp(data: VerifyOTP):
 @router.post("/user/resend/otp/")
 async def resend_otp(email: Optional[EmailStr] = Form(...)):
     try:
-        existing = await db.user.find_one({"email": email})
+        created = await db.user.find_one({"email": email}, {"name": 1, "email": 1, "is_verified": 1})
 
-        if not existing:
+        if not created:
             raise HTTPException(status_code=400,detail="Email Not Registered")
         
-        if existing["is_verified"] == True:
+        if created["is_verified"] == True:
             raise HTTPException(status_code=400, detail="Email Already Verified")
 
-        otp = generate_otp()
-        otp_expiry = datetime.utcnow() + timedelta(minutes=int(os.getenv("OTP_EXPIRE_MINUTES")))
-        doc = {
-            "is_verified": False,
-            "email_otp": otp,
-            "email_otp_expires_at": otp_expiry,
-        }
-
-        await db.user.update_one({"email": email}, {"$set": doc})
-        created = await db.user.find_one({"email": email})
-
-
-        # send OTP to email
-        await send_otp_email(email, otp)
+        # send OTP to email (429 inside the resend cooldown)
+        await otp.send(otp.USER_VERIFY, email)
 
         user_data = {
             "id": str(created["_id"]),
@@ -139,16 +120,24 @@ async def resend_otp(email: Optional[EmailStr] = Form(...)):
             "msg": "registered, OTP sent to your email",
             "user": user_data,
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.post("/user/login/")
-async def login(usertry: UserLogin):
+async def login(usertry: UserLogin, request: Request):
+    await rate_limit.check("user_login", request, usertry.email)
+
     try:
         user = await db.user.find_one({"email": usertry.email})
-        if not user or not verify_password(usertry.password, user["password"]):
+        valid, new_hash = (await verify_and_update_async(usertry.password, user["password"])) if user else (False, None)
+        if not valid:
             raise HTTPException(status_code=400, detail="Incorrect credentials-password")
+        if new_hash:
+            await db.user.update_one({"_id": user["_id"]}, {"$set": {"password": new_hash}})
+            principal_cache.invalidate(user["_id"])
 
         if not user.get("is_verified", False):
             raise HTTPException(
@@ -156,7 +145,7 @@ async def login(usertry: UserLogin):
                 detail="Please verify your email with OTP before login",
             )
 
-        token = create_access_token({"email": usertry.email})
+        token = create_access_token(principal_claims(user))
         return {"message": "Success Login", "access_token": token, "token_type": "bearer"}
     except HTTPException:
         raise
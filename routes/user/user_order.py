@@ -4,6 +4,7 @@ from utils.check import chk_user
 from datetime import datetime
 from bson import ObjectId
 from db.db import db
+from utils.product_cache import product_cache
 
 router = APIRouter()
 
@@ -63,6 +64,7 @@ async def cancel_order(order_id: str, current_user = Depends(get_current_user)):
                 {"_id": pid},
                 {"$inc": {"stock": qty}}
             )
+            product_cache.invalidate(pid)
 
         await db.order.update_one(
             {"_id": ObjectId(order_id)},
@@ -127,6 +129,7 @@ async def return_order(order_id: str, current_user = Depends(get_current_user)):
                 {"_id": pid},
                 {"$inc": {"stock": qty}}
             )
+            product_cache.invalidate(pid)
 
         await db.order.update_one(
             {"_id": ObjectId(order_id)},
@@ -0,0 +1,15 @@
+import os
+
+# settings are read at import time; these only fill in what the environment doesn't set
+for key, value in {
+    "DB_URI": "mongodb://localhost:27017",
+    "SUPABASE_URL": "http://localhost",
+    "SUPABASE_SERVICE_ROLE_KEY": "test",
+    "SECRET_KEY": "test-secret",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "60",
+    "MAIL": "test@example.com",
+    "MAIL_PASSWORD": "test",
+    "BCRYPT_ROUNDS": "4",
+}.items():
+    os.environ.setdefault(key, value)
@@ -0,0 +1,268 @@
+"""
+A small in-memory stand-in for the Motor collections these tests touch.
+It implements only the query/update operators the code under test uses, with
+the same matching, upsert and duplicate-key behaviour as MongoDB for them.
+"""
+import copy
+from types import SimpleNamespace
+
+from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+_MISSING = object()
+
+
+def _get(doc, path):
+    value = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _matches_op(value, op, arg):
+    if op == "$exists":
+        return (value is not _MISSING) == bool(arg)
+    if op == "$ne":
+        return value is _MISSING or value != arg
+    if op == "$in":
+        return value is not _MISSING and value in arg
+    if value is _MISSING or value is None:
+        return False
+    if op == "$eq":
+        return value == arg
+    if op == "$gt":
+        return value > arg
+    if op == "$gte":
+        return value >= arg
+    if op == "$lt":
+        return value < arg
+    if op == "$lte":
+        return value <= arg
+    raise NotImplementedError(op)
+
+
+def matches(doc, flt) -> bool:
+    for key, cond in (flt or {}).items():
+        if key == "$or":
+            if not any(matches(doc, f) for f in cond):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, f) for f in cond):
+                return False
+        elif isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond):
+            value = _get(doc, key)
+            if not all(_matches_op(value, op, arg) for op, arg in cond.items()):
+                return False
+        elif _get(doc, key) != cond:
+            return False
+    return True
+
+
+def _apply(doc, update, inserting: bool):
+    for op, fields in update.items():
+        for key, arg in fields.items():
+            if op == "$set" or (op == "$setOnInsert" and inserting):
+                doc[key] = arg
+            elif op == "$inc":
+                doc[key] = doc.get(key, 0) + arg
+            elif op == "$unset":
+                doc.pop(key, None)
+            elif op == "$max":
+                doc[key] = arg if key not in doc else max(doc[key], arg)
+            elif op != "$setOnInsert":
+                raise NotImplementedError(op)
+
+
+def _eval(expr, doc):
+    """Just enough aggregation expression support for cart_total_save."""
+    if isinstance(expr, str) and expr.startswith("$"):
+        value = _get(doc, expr[1:])
+        return None if value is _MISSING else value
+    if isinstance(expr, dict):
+        (op, arg), = expr.items()
+        if op == "$ifNull":
+            value = _eval(arg[0], doc)
+            return _eval(arg[1], doc) if value is None else value
+        if op == "$toDouble":
+            return float(_eval(arg, doc))
+        if op == "$multiply":
+            result = 1.0
+            for a in arg:
+                result *= _eval(a, doc)
+            return result
+        raise NotImplementedError(op)
+    return expr
+
+
+class _Cursor:
+    def __init__(self, docs):
+        self._docs = docs
+
+    def sort(self, keys, direction=None):
+        if isinstance(keys, str):
+            keys = [(keys, direction or 1)]
+        for key, d in reversed(list(keys)):
+            self._docs.sort(key=lambda doc: _get(doc, key), reverse=d < 0)
+        return self
+
+    def skip(self, n):
+        self._docs = self._docs[n:]
+        return self
+
+    def limit(self, n):
+        if n:
+            self._docs = self._docs[:n]
+        return self
+
+    async def to_list(self, length=None):
+        return self._docs if length is None else self._docs[:length]
+
+    def __aiter__(self):
+        self._iter = iter(self._docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    def __init__(self, unique=()):
+        self.docs = []
+        # extra unique keys besides _id, e.g. [("user", "item_id")]
+        self.unique = list(unique)
+
+    # ---------- helpers ----------
+    def _check_unique(self, doc, ignore=None):
+        for other in self.docs:
+            if other is ignore:
+                continue
+            if other["_id"] == doc["_id"]:
+                raise DuplicateKeyError("duplicate _id")
+            for fields in self.unique:
+                if all(other.get(f) == doc.get(f) for f in fields):
+                    raise DuplicateKeyError(f"duplicate {fields}")
+
+    def _first(self, flt, sort=None):
+        found = [d for d in self.docs if matches(d, flt)]
+        if sort:
+            found = _Cursor(found).sort(sort)._docs
+        return found[0] if found else None
+
+    def _upsert_doc(self, flt, update):
+        doc = {k: v for k, v in flt.items() if not k.startswith("$") and not isinstance(v, dict)}
+        _apply(doc, update, inserting=True)
+        doc.setdefault("_id", ObjectId())
+        self._check_unique(doc)
+        self.docs.append(doc)
+        return doc
+
+    # ---------- Motor-like API ----------
+    async def insert_one(self, doc, **kwargs):
+        doc = copy.deepcopy(doc)
+        doc.setdefault("_id", ObjectId())
+        self._check_unique(doc)
+        self.docs.append(doc)
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    async def insert_many(self, docs, **kwargs):
+        for doc in docs:
+            await self.insert_one(doc)
+
+    async def find_one(self, flt=None, projection=None, **kwargs):
+        doc = self._first(flt or {})
+        return copy.deepcopy(doc) if doc else None
+
+    def find(self, flt=None, projection=None, **kwargs):
+        return _Cursor([copy.deepcopy(d) for d in self.docs if matches(d, flt or {})])
+
+    async def count_documents(self, flt, **kwargs):
+        return sum(1 for d in self.docs if matches(d, flt))
+
+    async def update_one(self, flt, update, upsert=False, **kwargs):
+        doc = self._first(flt)
+        if doc is None:
+            if not upsert:
+                return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+            new = self._upsert_doc(flt, update)
+            return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=new["_id"])
+        before = copy.deepcopy(doc)
+        _apply(doc, update, inserting=False)
+        return SimpleNamespace(matched_count=1, modified_count=int(doc != before), upserted_id=None)
+
+    async def update_many(self, flt, update, **kwargs):
+        matched = [d for d in self.docs if matches(d, flt)]
+        for doc in matched:
+            _apply(doc, update, inserting=False)
+        return SimpleNamespace(matched_count=len(matched), modified_count=len(matched))
+
+    async def find_one_and_update(self, flt, update, upsert=False, return_document=ReturnDocument.BEFORE,
+                                  sort=None, projection=None, **kwargs):
+        doc = self._first(flt, sort)
+        if doc is None:
+            if not upsert:
+                return None
+            new = self._upsert_doc(flt, update)
+            return copy.deepcopy(new) if return_document == ReturnDocument.AFTER else None
+        before = copy.deepcopy(doc)
+        _apply(doc, update, inserting=False)
+        return copy.deepcopy(doc) if return_document == ReturnDocument.AFTER else before
+
+    async def delete_one(self, flt, **kwargs):
+        doc = self._first(flt)
+        if doc is not None:
+            self.docs.remove(doc)
+        return SimpleNamespace(deleted_count=int(doc is not None))
+
+    async def delete_many(self, flt, **kwargs):
+        gone = [d for d in self.docs if matches(d, flt)]
+        for doc in gone:
+            self.docs.remove(doc)
+        return SimpleNamespace(deleted_count=len(gone))
+
+    async def find_one_and_delete(self, flt, **kwargs):
+        doc = self._first(flt)
+        if doc is not None:
+            self.docs.remove(doc)
+        return doc
+
+    async def bulk_write(self, ops, ordered=True, **kwargs):
+        modified = 0
+        for op in ops:
+            res = await self.update_one(op._filter, op._doc, upsert=bool(op._upsert))
+            modified += res.modified_count
+        return SimpleNamespace(modified_count=modified)
+
+    def aggregate(self, pipeline, **kwargs):
+        docs = list(self.docs)
+        for stage in pipeline:
+            (name, spec), = stage.items()
+            if name == "$match":
+                docs = [d for d in docs if matches(d, spec)]
+            elif name == "$group" and spec["_id"] is None:
+                group = {"_id": None}
+                for field, acc in spec.items():
+                    if field != "_id":
+                        group[field] = sum(_eval(acc["$sum"], d) for d in docs)
+                docs = [group] if docs else []
+            else:
+                raise NotImplementedError(name)
+        return _Cursor(docs)
+
+
+class FakeDb:
+    def __init__(self, **unique):
+        self._collections = {name: FakeCollection(keys) for name, keys in unique.items()}
+
+    def __getitem__(self, name):
+        return self._collections.setdefault(name, FakeCollection())
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
@@ -0,0 +1,96 @@
+import asyncio
+import random
+
+import pytest
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from tests.mongo_stub import FakeDb
+from utils import utility
+from utils.utility import apply_cart_delta, cart_total_save, line_totals, verify_cart_total
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = FakeDb(cart=[("user", "item_id")])
+    monkeypatch.setattr(utility, "db", db)
+    return db
+
+
+# the same line mutations the cart routes make, each followed by its delta
+
+async def _set_quantity(db, user_id, item_id, product, qty):
+    before = await db.cart.find_one_and_update(
+        {"user": user_id, "item_id": item_id},
+        {
+            "$set": {"quantity": qty},
+            "$setOnInsert": {"price": product["price"], "final_price": product["final_price"]},
+        },
+        upsert=True,
+        return_document=ReturnDocument.BEFORE,
+    )
+    old_total, old_final = line_totals(before)
+    new_total, new_final = line_totals({**(before or product), "quantity": qty})
+    return await apply_cart_delta(user_id, new_total - old_total, new_final - old_final)
+
+
+async def _remove(db, user_id, item_id):
+    removed = await db.cart.find_one_and_delete({"user": user_id, "item_id": item_id})
+    old_total, old_final = line_totals(removed)
+    return await apply_cart_delta(user_id, -old_total, -old_final)
+
+
+def test_first_delta_builds_header_from_lines(fake_db):
+    user_id = ObjectId()
+    product = {"price": 100.0, "final_price": 90.0}
+
+    total, final = asyncio.run(_set_quantity(fake_db, user_id, "p1", product, 2))
+
+    assert (total, final) == (200.0, 180.0)
+    assert fake_db.cart_total.docs == [{"_id": user_id, "total": 200.0, "final_total": 180.0}]
+
+
+def test_delta_total_equals_recomputed_total(fake_db):
+    user_id = ObjectId()
+    rng = random.Random(7)
+    products = {
+        f"p{i}": {"price": round(rng.uniform(1, 500), 2), "final_price": round(rng.uniform(1, 500), 2)}
+        for i in range(6)
+    }
+
+    async def run():
+        running = (0.0, 0.0)
+        for _ in range(200):
+            item_id = rng.choice(list(products))
+            if rng.random() < 0.25:
+                if await fake_db.cart.count_documents({"user": user_id, "item_id": item_id}):
+                    running = await _remove(fake_db, user_id, item_id)
+            else:
+                running = await _set_quantity(fake_db, user_id, item_id, products[item_id], rng.randint(1, 9))
+        return running, await verify_cart_total(user_id)
+
+    (total, final), report = asyncio.run(run())
+
+    assert report["drifted"] is False
+    assert total == pytest.approx(report["total"])
+    assert final == pytest.approx(report["with_discount"])
+
+
+def test_verify_repairs_drifted_header(fake_db):
+    user_id = ObjectId()
+    product = {"price": 10.0, "final_price": 8.0}
+
+    async def run():
+        await _set_quantity(fake_db, user_id, "p1", product, 3)
+        # a line written behind the header's back
+        await fake_db.cart.insert_one({"user": user_id, "item_id": "p2", "quantity": 1,
+                                       "price": 5.0, "final_price": 5.0})
+        report = await verify_cart_total(user_id)
+        return report, await verify_cart_total(user_id)
+
+    first, second = asyncio.run(run())
+
+    assert first["drifted"] is True
+    assert first["drift"] == {"total": 5.0, "with_discount": 5.0}
+    assert second["drifted"] is False
+    assert asyncio.run(cart_total_save(user_id)) == (35.0, 29.0)
@@ -0,0 +1,102 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from tests.mongo_stub import FakeDb
+from utils import idempotency
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = FakeDb()
+    monkeypatch.setattr(idempotency, "db", db)
+    return db
+
+
+def _counting_work(result=None, delay=0.0):
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(delay)
+        return result or {"order": len(calls)}
+
+    return work, calls
+
+
+def test_same_key_replays_the_response(fake_db):
+    work, calls = _counting_work()
+
+    async def run():
+        first = await idempotency.idempotent("k1", "create_order", "a@x.com", "fp", work)
+        second = await idempotency.idempotent("k1", "create_order", "a@x.com", "fp", work)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == second == {"order": 1}
+    assert len(calls) == 1
+    assert fake_db.idempotency.docs[0]["status"] == "completed"
+
+
+def test_concurrent_duplicate_waits_for_the_first(fake_db):
+    work, calls = _counting_work(delay=0.05)
+
+    async def run():
+        return await asyncio.gather(*[
+            idempotency.idempotent("k1", "create_order", "a@x.com", "fp", work) for _ in range(3)
+        ])
+
+    results = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(r == results[0] for r in results)
+
+
+def test_key_reused_with_another_body_is_rejected(fake_db):
+    work, _ = _counting_work()
+
+    async def run():
+        await idempotency.idempotent("k1", "add_item", "a@x.com", "fp-1", work)
+        await idempotency.idempotent("k1", "add_item", "a@x.com", "fp-2", work)
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(run())
+    assert exc.value.status_code == 422
+
+
+def test_failed_attempt_is_not_stored(fake_db):
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise HTTPException(status_code=400, detail="Cart is empty")
+        return {"ok": True}
+
+    async def run():
+        with pytest.raises(HTTPException):
+            await idempotency.idempotent("k1", "create_order", "a@x.com", "fp", flaky)
+        return await idempotency.idempotent("k1", "create_order", "a@x.com", "fp", flaky)
+
+    assert asyncio.run(run()) == {"ok": True}
+    assert len(calls) == 2
+
+
+def test_stale_in_progress_record_is_taken_over(fake_db):
+    # a worker died mid-request: its lease is over, so the retry runs the work
+    now = datetime.utcnow()
+    fake_db.idempotency.docs.append({
+        "_id": "create_order:a@x.com:k1",
+        "fingerprint": "fp",
+        "status": "in_progress",
+        "locked_until": now - timedelta(seconds=1),
+        "created_at": now - timedelta(minutes=5),
+        "expires_at": now + timedelta(hours=1),
+    })
+    work, calls = _counting_work()
+
+    result = asyncio.run(idempotency.idempotent("k1", "create_order", "a@x.com", "fp", work))
+    assert result == {"order": 1}
+    assert len(calls) == 1
+    assert fake_db.idempotency.docs[0]["status"] == "completed"
@@ -0,0 +1,104 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+
+from tests.mongo_stub import FakeDb
+from utils import otp
+from utils.settings import settings
+
+EMAIL = "Buyer@Example.com"
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = FakeDb()
+    monkeypatch.setattr(otp, "db", db)
+    return db
+
+
+def _age(db, seconds):
+    """Pretend the stored code went out `seconds` earlier."""
+    for doc in db.otp.docs:
+        doc["sent_at"] -= timedelta(seconds=seconds)
+
+
+def test_code_is_stored_hashed(fake_db):
+    code = asyncio.run(otp.issue(otp.USER_VERIFY, EMAIL))
+
+    (doc,) = fake_db.otp.docs
+    assert doc["_id"] == "user_verify:buyer@example.com"
+    assert code not in doc["code_hash"]
+    assert doc["attempts"] == 0
+
+
+def test_otp_cannot_be_reused(fake_db):
+    async def run():
+        code = await otp.issue(otp.USER_VERIFY, EMAIL)
+        return (
+            await otp.verify(otp.USER_VERIFY, EMAIL.lower(), code),
+            await otp.verify(otp.USER_VERIFY, EMAIL, code),
+        )
+
+    assert asyncio.run(run()) == (True, False)
+    assert fake_db.otp.docs == []
+
+
+def test_code_is_bound_to_its_purpose(fake_db):
+    async def run():
+        code = await otp.issue(otp.USER_VERIFY, EMAIL)
+        return await otp.verify(otp.USER_RESET, EMAIL, code)
+
+    assert asyncio.run(run()) is False
+
+
+def test_resend_inside_cooldown_is_429(fake_db):
+    async def run():
+        first = await otp.issue(otp.USER_VERIFY, EMAIL)
+        with pytest.raises(HTTPException) as exc:
+            await otp.issue(otp.USER_VERIFY, EMAIL)
+        return first, exc.value
+
+    first, err = asyncio.run(run())
+
+    assert err.status_code == 429
+    assert 1 <= int(err.headers["Retry-After"]) <= settings.otp_resend_cooldown_seconds
+    # the code already sent still works
+    assert asyncio.run(otp.verify(otp.USER_VERIFY, EMAIL, first)) is True
+
+
+def test_resend_after_cooldown_replaces_code(fake_db):
+    async def run():
+        old = await otp.issue(otp.USER_VERIFY, EMAIL)
+        _age(fake_db, settings.otp_resend_cooldown_seconds)
+        new = await otp.issue(otp.USER_VERIFY, EMAIL)
+        return old, new
+
+    old, new = asyncio.run(run())
+    if old == new:
+        pytest.skip("issued the same six digits twice")
+
+    assert asyncio.run(otp.verify(otp.USER_VERIFY, EMAIL, old)) is False
+    assert asyncio.run(otp.verify(otp.USER_VERIFY, EMAIL, new)) is True
+
+
+def test_attempts_are_exhausted(fake_db):
+    async def run():
+        code = await otp.issue(otp.USER_VERIFY, EMAIL)
+        wrong = f"{(int(code) + 1) % 10 ** 6:06d}"
+        for _ in range(settings.otp_max_attempts):
+            assert await otp.verify(otp.USER_VERIFY, EMAIL, wrong) is False
+        return await otp.verify(otp.USER_VERIFY, EMAIL, code)
+
+    assert asyncio.run(run()) is False
+    assert fake_db.otp.docs == []
+
+
+def test_expired_code_fails(fake_db):
+    async def run():
+        code = await otp.issue(otp.USER_VERIFY, EMAIL)
+        fake_db.otp.docs[0]["expires_at"] = datetime.utcnow() - timedelta(seconds=1)
+        return await otp.verify(otp.USER_VERIFY, EMAIL, code)
+
+    assert asyncio.run(run()) is False
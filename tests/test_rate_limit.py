@@ -0,0 +1,78 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from routes.user import user as user_routes
+from utils import rate_limit, security
+
+
+class _Users:
+    def __init__(self, doc):
+        self.doc = doc
+
+    async def find_one(self, query):
+        return self.doc if query.get("email") == self.doc["email"] else None
+
+
+class _Db:
+    def __init__(self, doc):
+        self.user = _Users(doc)
+
+
+@pytest.fixture
+def login_client(monkeypatch):
+    doc = {
+        "_id": "u1",
+        "email": "victim@example.com",
+        "password": security.hash_password("right-password"),
+        "is_verified": True,
+    }
+    monkeypatch.setattr(user_routes, "db", _Db(doc))
+    monkeypatch.setattr(rate_limit, "_buckets", rate_limit.TokenBuckets(1000))
+    monkeypatch.setattr(rate_limit.settings, "rate_limit_enabled", True)
+    monkeypatch.setattr(rate_limit.settings, "rate_limit_backend", "memory")
+
+    # count what actually reaches the bcrypt pool
+    calls = []
+    run_hash = security._run_hash
+
+    async def counting_run_hash(fn, *args):
+        calls.append(fn)
+        return await run_hash(fn, *args)
+
+    monkeypatch.setattr(security, "_run_hash", counting_run_hash)
+
+    app = FastAPI()
+    app.include_router(user_routes.router)
+    return TestClient(app), calls
+
+
+def test_account_flood_stops_before_bcrypt(login_client):
+    client, calls = login_client
+    capacity, _ = rate_limit.parse_limit(rate_limit.ROUTE_LIMITS["user_login"]["account"])
+
+    responses = [
+        client.post("/user/login/", json={"email": "victim@example.com", "password": f"guess-{i}"})
+        for i in range(capacity * 10)
+    ]
+
+    assert len(calls) <= capacity
+    assert all(r.status_code == 400 for r in responses[:capacity])
+    rejected = responses[capacity:]
+    assert all(r.status_code == 429 for r in rejected)
+    assert all(int(r.headers["Retry-After"]) >= 1 for r in rejected)
+
+
+def test_ip_flood_across_accounts_is_capped(login_client):
+    client, calls = login_client
+    capacity, _ = rate_limit.parse_limit(rate_limit.ROUTE_LIMITS["user_login"]["ip"])
+
+    # a different account every time, so only the per-IP bucket can stop it
+    statuses = [
+        client.post("/user/login/", json={"email": f"user{i}@example.com", "password": "x"}).status_code
+        for i in range(capacity * 3)
+    ]
+
+    assert statuses.count(429) == capacity * 2
+    # unknown accounts never reach bcrypt, and nothing past the cap does either
+    assert len(calls) == 0
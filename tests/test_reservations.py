@@ -0,0 +1,133 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+from tests.mongo_stub import FakeDb
+from utils import reservations
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = FakeDb(reservation=[("user", "item_id")])
+    monkeypatch.setattr(reservations, "db", db)
+    return db
+
+
+def _product(db, stock):
+    pid = ObjectId()
+    db.product.docs.append({"_id": pid, "stock": stock})
+    return str(pid)
+
+
+def _stock(db, pid):
+    return next(p["stock"] for p in db.product.docs if str(p["_id"]) == pid)
+
+
+def test_split_against_holds():
+    need, surplus = reservations.split_against_holds(
+        [("a", 3), ("b", 2), ("c", 1)],
+        {"a": 1, "b": 2, "c": 4},
+    )
+    assert need == [("a", 2)]
+    assert surplus == [("c", 3)]
+
+
+def test_hold_takes_stock_and_adjusts(fake_db):
+    pid = _product(fake_db, 10)
+    user = ObjectId()
+
+    async def run():
+        assert await reservations.hold(user, pid, 4)
+        assert _stock(fake_db, pid) == 6
+        # a second call moves the hold to the new quantity, in both directions
+        assert await reservations.hold(user, pid, 7)
+        assert _stock(fake_db, pid) == 3
+        assert await reservations.hold(user, pid, 2)
+        assert _stock(fake_db, pid) == 8
+
+    asyncio.run(run())
+    assert [r["quantity"] for r in fake_db.reservation.docs] == [2]
+
+
+def test_hold_beyond_stock_keeps_previous_hold(fake_db):
+    pid = _product(fake_db, 5)
+    user = ObjectId()
+
+    async def run():
+        assert await reservations.hold(user, pid, 3)
+        assert not await reservations.hold(user, pid, 9)
+
+    asyncio.run(run())
+    assert _stock(fake_db, pid) == 2
+    assert [r["quantity"] for r in fake_db.reservation.docs] == [3]
+
+
+def test_concurrent_holds_never_oversell(fake_db):
+    pid = _product(fake_db, 5)
+    users = [ObjectId() for _ in range(20)]
+
+    async def run():
+        return await asyncio.gather(*[reservations.hold(u, pid, 1) for u in users])
+
+    granted = asyncio.run(run())
+    assert sum(granted) == 5
+    assert _stock(fake_db, pid) == 0
+    assert sum(r["quantity"] for r in fake_db.reservation.docs) == 5
+
+
+def test_consume_returns_held_units_without_touching_stock(fake_db):
+    pid = _product(fake_db, 10)
+    user = ObjectId()
+
+    async def run():
+        await reservations.hold(user, pid, 4)
+        return await reservations.consume(user, [pid])
+
+    assert asyncio.run(run()) == {pid: 4}
+    assert _stock(fake_db, pid) == 6
+    assert fake_db.reservation.docs == []
+
+
+def test_consume_skips_expired_holds(fake_db):
+    pid = _product(fake_db, 6)
+    user = ObjectId()
+    fake_db.reservation.docs.append({
+        "_id": ObjectId(), "user": user, "item_id": pid, "quantity": 4,
+        "expires_at": datetime.utcnow() - timedelta(seconds=1),
+    })
+
+    assert asyncio.run(reservations.consume(user, [pid])) == {}
+
+
+def test_expired_hold_returns_stock(fake_db):
+    pid = _product(fake_db, 10)
+    live_user, stale_user = ObjectId(), ObjectId()
+
+    async def run():
+        await reservations.hold(live_user, pid, 2)
+        await reservations.hold(stale_user, pid, 3)
+        for r in fake_db.reservation.docs:
+            if r["user"] == stale_user:
+                r["expires_at"] = datetime.utcnow() - timedelta(seconds=1)
+        return await reservations.sweep_expired()
+
+    assert asyncio.run(run()) == 1
+    assert _stock(fake_db, pid) == 8
+    assert [r["user"] for r in fake_db.reservation.docs] == [live_user]
+
+
+def test_restore_puts_consumed_holds_back(fake_db):
+    pid = _product(fake_db, 10)
+    user = ObjectId()
+
+    async def run():
+        await reservations.hold(user, pid, 4)
+        held = await reservations.consume(user, [pid])
+        await reservations.restore(user, held)
+        return await reservations.active_holds(user)
+
+    assert asyncio.run(run()) == {pid: 4}
+    # the units stayed with the user the whole time
+    assert _stock(fake_db, pid) == 6
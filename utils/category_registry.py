@@ -0,0 +1,68 @@
+import asyncio
+import time
+from typing import List, Tuple
+
+from db.db import db
+from utils.settings import settings
+
+VERSION_ID = "category_version"
+
+
+class CategoryRegistry:
+    """
+    In-memory copy of db.category.
+    Every write bumps a version stamp in db.meta; other workers compare stamps
+    at most once per check_interval and reload only when it moved.
+    """
+
+    def __init__(self, check_interval: float):
+        self.check_interval = check_interval
+        self.version = None
+        self.etag = None
+        self._names = set()
+        self._items: List[dict] = []
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def _stored_version(self) -> int:
+        doc = await db.meta.find_one({"_id": VERSION_ID}, {"version": 1})
+        return doc["version"] if doc else 0
+
+    async def load(self):
+        async with self._lock:
+            version = await self._stored_version()
+            categories = await db.category.find().to_list(length=None)
+            self._items = [
+                {"id": str(c["_id"]), "category": c.get("category", "")}
+                for c in categories
+            ]
+            self._names = {c["category"] for c in self._items}
+            self.version = version
+            self.etag = f'"categories-{version}"'
+            self._checked_at = time.monotonic()
+
+    async def refresh(self):
+        """Call after any category write: bump the shared stamp and reload locally."""
+        await db.meta.update_one({"_id": VERSION_ID}, {"$inc": {"version": 1}}, upsert=True)
+        await self.load()
+
+    async def ensure_fresh(self):
+        if self.version is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return
+        if self.version is None or await self._stored_version() != self.version:
+            await self.load()
+        else:
+            self._checked_at = time.monotonic()
+
+    async def exists(self, name: str) -> bool:
+        await self.ensure_fresh()
+        return name in self._names
+
+    async def listing(self) -> Tuple[List[dict], str]:
+        await self.ensure_fresh()
+        return self._items, self.etag
+
+
+category_registry = CategoryRegistry(
+    check_interval=settings.category_version_check_seconds,
+)
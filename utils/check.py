@@ -1,14 +1,47 @@
+from bson import ObjectId
 from db.db import db
 from fastapi import HTTPException
+from utils.principal_cache import principal_cache
 
-async def chk_user(current_user):
-    user = await db.user.find_one({"email": current_user["email"]})
-    if not user or user.get("role") != "user":
+
+def _check_token_version(account: dict, current_user: dict):
+    if account.get("token_version", 0) != (current_user.get("tv") or 0):
+        raise HTTPException(status_code=401, detail="Token has been revoked")
+
+
+async def _resolve(current_user, role: str, collection: str):
+    """
+    Account document for the token. Tokens carrying sub/role/tv are served from
+    the principal cache; tv must match the account's token_version, which
+    password reset bumps. Older email-only tokens still go to the database and
+    count as tv 0, so any reset since they were issued revokes them too.
+    """
+    sub = current_user.get("sub")
+    if not sub or not ObjectId.is_valid(sub):
+        account = await db[collection].find_one({"email": current_user["email"]})
+        if not account or account.get("role") != role:
+            raise HTTPException(status_code=400, detail="You can not perform this action")
+        _check_token_version(account, current_user)
+        return account
+
+    if current_user.get("role") != role:
         raise HTTPException(status_code=400, detail="You can not perform this action")
-    return user
 
-async def chk_seller(current_user):
-    seller = await db.seller.find_one({"email": current_user["email"]})
-    if not seller or seller.get("role") != "seller":
+    account = principal_cache.get(sub)
+    if account is None:
+        account = await db[collection].find_one({"_id": ObjectId(sub)})
+        if account is not None:
+            principal_cache.put(sub, account)
+    if not account or account.get("role") != role:
         raise HTTPException(status_code=400, detail="You can not perform this action")
-    return seller
\ No newline at end of file
+    _check_token_version(account, current_user)
+    return account
+
+async def chk_user(current_user):
+    return await _resolve(current_user, "user", "user")
+
+async def chk_seller(current_user):
+    return await _resolve(current_user, "seller", "seller")
+
+async def chk_admin(current_user):
+    return await _resolve(current_user, "admin", "user")
@@ -1,19 +1,18 @@
 from fastapi_mail import ConnectionConfig
-import os
-from dotenv import load_dotenv
-load_dotenv()
+from utils.settings import settings
 
 
-MAIL = os.getenv("MAIL")
-MAIL_PASSWORD = os.getenv("MAIL_PASSWORD")
+MAIL = settings.mail
+MAIL_PASSWORD = settings.mail_password.get_secret_value()
+# MAIL_SERVER/MAIL_PORT can point at a local SMTP stand-in
+# (e.g. `python -m aiosmtpd -n -l localhost:1025` with MAIL_STARTTLS=false USE_CREDENTIALS=false)
 conf = ConnectionConfig(
     MAIL_USERNAME=MAIL,
     MAIL_PASSWORD=MAIL_PASSWORD,
-    MAIL_FROM="donharsh1011@gmail.com",
-    MAIL_PORT=587,
-    MAIL_SERVER="smtp.gmail.com",
-    MAIL_STARTTLS=True,
-    MAIL_SSL_TLS=False,
-    USE_CREDENTIALS=True
+    MAIL_FROM=settings.mail_from,
+    MAIL_PORT=settings.mail_port,
+    MAIL_SERVER=settings.mail_server,
+    MAIL_STARTTLS=settings.mail_starttls,
+    MAIL_SSL_TLS=settings.mail_ssl_tls,
+    USE_CREDENTIALS=settings.use_credentials,
 )
-
@@ -0,0 +1,171 @@
+import asyncio
+import random
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from pymongo import ReturnDocument
+
+from db.db import db
+from utils.settings import settings
+from utils.smtp_pool import smtp_pool, build_message
+
+OUTBOX_CONCURRENCY = settings.outbox_concurrency
+OUTBOX_MAX_ATTEMPTS = settings.outbox_max_attempts
+OUTBOX_POLL_SECONDS = settings.outbox_poll_seconds
+OUTBOX_LEASE_SECONDS = settings.outbox_lease_seconds
+OUTBOX_BACKOFF_SECONDS = settings.outbox_backoff_seconds
+OUTBOX_BACKOFF_MAX_SECONDS = settings.outbox_backoff_max_seconds
+
+_wakeup = asyncio.Event()
+_tasks: List[asyncio.Task] = []
+
+
+def email_message(
+    to_email: str,
+    subject: str,
+    body: str,
+    subtype: str = "plain",
+    text_body: str = None,
+    redact: bool = False,
+) -> dict:
+    """redact=True drops the body once the message is sent or given up on (it carries a secret)."""
+    message = {"to": to_email, "subject": subject, "body": body, "subtype": subtype}
+    if text_body is not None:
+        message["text_body"] = text_body
+    if redact:
+        message["redact"] = True
+    return message
+
+
+async def enqueue_emails(messages: List[dict], session=None):
+    """Write messages to the outbox; pass the session to commit them with the caller's transaction."""
+    if not messages:
+        return
+    now = datetime.utcnow()
+    docs = [
+        {
+            **m,
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now,
+        }
+        for m in messages
+    ]
+    await db.email_outbox.insert_many(docs, session=session)
+    _wakeup.set()
+
+
+async def enqueue_email(to_email: str, subject: str, body: str, subtype: str = "plain", session=None, redact: bool = False):
+    await enqueue_emails([email_message(to_email, subject, body, subtype, redact=redact)], session=session)
+
+
+async def _claim() -> Optional[dict]:
+    """Lease the next due message; an expired lease means a worker died mid-send."""
+    now = datetime.utcnow()
+    return await db.email_outbox.find_one_and_update(
+        {
+            "$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                {"status": "sending", "lease_until": {"$lte": now}},
+            ]
+        },
+        {
+            "$set": {"status": "sending", "lease_until": now + timedelta(seconds=OUTBOX_LEASE_SECONDS)},
+            "$inc": {"attempts": 1},
+        },
+        sort=[("next_attempt_at", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+async def _send(doc: dict):
+    await smtp_pool.send(build_message(
+        doc["to"],
+        doc["subject"],
+        doc["body"],
+        subtype=doc.get("subtype", "plain"),
+        text_body=doc.get("text_body"),
+    ))
+
+
+def _backoff(attempts: int) -> float:
+    delay = min(OUTBOX_BACKOFF_SECONDS * (2 ** (attempts - 1)), OUTBOX_BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+async def _deliver(doc: dict):
+    # once a message is finished with, a redacted one keeps only its envelope
+    finished_unset = {"body": "", "text_body": ""} if doc.get("redact") else {}
+    try:
+        await _send(doc)
+    except Exception as e:
+        unset = {"lease_until": ""}
+        if doc["attempts"] >= OUTBOX_MAX_ATTEMPTS:
+            update = {"status": "failed", "last_error": str(e), "failed_at": datetime.utcnow()}
+            unset.update(finished_unset)
+        else:
+            update = {
+                "status": "pending",
+                "last_error": str(e),
+                "next_attempt_at": datetime.utcnow() + timedelta(seconds=_backoff(doc["attempts"])),
+            }
+        await db.email_outbox.update_one({"_id": doc["_id"]}, {"$set": update, "$unset": unset})
+        return
+
+    await db.email_outbox.update_one(
+        {"_id": doc["_id"]},
+        {
+            "$set": {"status": "sent", "sent_at": datetime.utcnow()},
+            "$unset": {"lease_until": "", "last_error": "", **finished_unset},
+        },
+    )
+
+
+async def _worker():
+    while True:
+        try:
+            doc = await _claim()
+        except Exception as e:
+            print("Email outbox claim error:", e)
+            doc = None
+
+        if doc is None:
+            _wakeup.clear()
+            try:
+                await asyncio.wait_for(_wakeup.wait(), OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        try:
+            await _deliver(doc)
+        except Exception as e:
+            # the lease runs out and another claim picks the message up again
+            print("Email outbox delivery error:", e)
+
+
+def start_worker():
+    """Run OUTBOX_CONCURRENCY senders inside the current event loop."""
+    if _tasks:
+        return
+    for _ in range(OUTBOX_CONCURRENCY):
+        _tasks.append(asyncio.create_task(_worker()))
+
+
+async def stop_worker():
+    for task in _tasks:
+        task.cancel()
+    await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
+    await smtp_pool.close()
+
+
+async def run_forever():
+    start_worker()
+    await asyncio.gather(*_tasks)
+
+
+if __name__ == "__main__":
+    # standalone worker: python -m utils.email_outbox
+    asyncio.run(run_forever())
@@ -0,0 +1,129 @@
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from pymongo.errors import DuplicateKeyError
+
+from db.db import db
+from utils.settings import settings
+
+IDEMPOTENCY_TTL_SECONDS = settings.idempotency_ttl_seconds
+IDEMPOTENCY_LOCK_SECONDS = settings.idempotency_lock_seconds
+IDEMPOTENCY_WAIT_SECONDS = settings.idempotency_wait_seconds
+IDEMPOTENCY_POLL_SECONDS = settings.idempotency_poll_seconds
+MAX_KEY_LENGTH = 255
+
+# requests running in this process, so same-process duplicates wake up without polling
+_inflight: Dict[str, asyncio.Event] = {}
+
+
+def request_fingerprint(*parts: Any) -> str:
+    """Hash of whatever identifies the request body; a key reused with a different body is rejected."""
+    raw = json.dumps(jsonable_encoder(parts), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+async def _claim(record_id: str, fingerprint: str) -> bool:
+    now = datetime.utcnow()
+    try:
+        await db.idempotency.insert_one({
+            "_id": record_id,
+            "fingerprint": fingerprint,
+            "status": "in_progress",
+            "locked_until": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS),
+            "created_at": now,
+            "expires_at": now + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+        })
+        return True
+    except DuplicateKeyError:
+        return False
+
+
+async def _take_over(record_id: str) -> bool:
+    """Claim a record whose owner stopped without finishing (crashed worker)."""
+    now = datetime.utcnow()
+    res = await db.idempotency.update_one(
+        {"_id": record_id, "status": "in_progress", "locked_until": {"$lte": now}},
+        {"$set": {"locked_until": now + timedelta(seconds=IDEMPOTENCY_LOCK_SECONDS)}},
+    )
+    return res.modified_count == 1
+
+
+async def _wait_for_result(record_id: str, fingerprint: str) -> Optional[dict]:
+    """
+    Wait for the first request with this key to finish and return its record.
+    Returns None when the key is free to run again (first request failed, or
+    its lease expired and we took it over).
+    """
+    deadline = asyncio.get_running_loop().time() + IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        record = await db.idempotency.find_one({"_id": record_id})
+        if record is None:
+            if await _claim(record_id, fingerprint):
+                return None
+            continue
+        if record["fingerprint"] != fingerprint:
+            raise HTTPException(status_code=422, detail="Idempotency-Key was already used with a different request")
+        if record["status"] == "completed":
+            return record
+        if await _take_over(record_id):
+            return None
+
+        remaining = deadline - asyncio.get_running_loop().time()
+        if remaining <= 0:
+            raise HTTPException(status_code=409, detail="A request with this Idempotency-Key is still in progress")
+        event = _inflight.get(record_id)
+        try:
+            if event is not None:
+                await asyncio.wait_for(event.wait(), min(remaining, IDEMPOTENCY_LOCK_SECONDS))
+            else:
+                await asyncio.sleep(min(remaining, IDEMPOTENCY_POLL_SECONDS))
+        except asyncio.TimeoutError:
+            pass
+
+
+async def idempotent(
+    key: Optional[str],
+    scope: str,
+    owner: str,
+    fingerprint: str,
+    work: Callable[[], Awaitable[Any]],
+) -> Any:
+    """
+    Run `work` at most once per (scope, owner, Idempotency-Key).
+    A repeat gets the stored response back; a concurrent repeat waits for the
+    first one. Failed attempts are not stored, so the client can retry them.
+    Without a key the work simply runs.
+    """
+    if not key:
+        return await work()
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Idempotency-Key is too long")
+
+    record_id = f"{scope}:{owner}:{key}"
+    if not await _claim(record_id, fingerprint):
+        record = await _wait_for_result(record_id, fingerprint)
+        if record is not None:
+            return record["response"]
+
+    event = _inflight[record_id] = asyncio.Event()
+    try:
+        result = await work()
+    except BaseException:
+        await db.idempotency.delete_one({"_id": record_id, "status": "in_progress"})
+        raise
+    else:
+        response = jsonable_encoder(result)
+        await db.idempotency.update_one(
+            {"_id": record_id},
+            {"$set": {"status": "completed", "response": response, "completed_at": datetime.utcnow()},
+             "$unset": {"locked_until": ""}},
+        )
+        return response
+    finally:
+        _inflight.pop(record_id, None)
+        event.set()
@@ -0,0 +1,145 @@
+import asyncio
+import io
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict
+
+from PIL import Image
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from db.db import db
+from utils import storage
+from utils.settings import settings
+
+# derivative name -> longest edge in px
+DERIVATIVE_SIZES = {"thumb": 200, "medium": 600}
+# how long store_image waits for a concurrent release to finish deleting the same image
+RELEASE_WAIT_SECONDS = 5
+RELEASE_POLL_SECONDS = 0.05
+
+# decoding is memory-heavy, so only a few images are rendered at once
+_render_executor = ThreadPoolExecutor(max_workers=settings.image_render_workers, thread_name_prefix="image")
+
+
+def _paths(image_hash: str, ext: str) -> Dict[str, str]:
+    paths = {"original": f"products/{image_hash}.{ext}"}
+    for name in DERIVATIVE_SIZES:
+        paths[name] = f"products/{image_hash}_{name}.webp"
+    return paths
+
+
+def _urls(paths: Dict[str, str]) -> dict:
+    return {
+        "image_url": storage.public_url(paths["original"]),
+        "thumb_url": storage.public_url(paths["thumb"]),
+        "medium_url": storage.public_url(paths["medium"]),
+    }
+
+
+def _render_derivatives(local_path: str) -> Dict[str, bytes]:
+    """
+    Largest derivative first, each shrunk from the previous one, so the full-size
+    image is never converted; draft() lets JPEGs decode at a reduced scale.
+    """
+    out = {}
+    largest = max(DERIVATIVE_SIZES.values())
+    with Image.open(local_path) as img:
+        if img.width * img.height > storage.MAX_IMAGE_PIXELS:
+            raise storage.UploadRejected(413, f"Image larger than {storage.MAX_IMAGE_PIXELS} pixels")
+        img.draft("RGB", (largest, largest))
+        for name, edge in sorted(DERIVATIVE_SIZES.items(), key=lambda kv: kv[1], reverse=True):
+            img.thumbnail((edge, edge))
+            img = img.convert("RGB")
+            buf = io.BytesIO()
+            img.save(buf, format="WEBP", quality=80)
+            out[name] = buf.getvalue()
+    return out
+
+
+async def _upload_all(staged: storage.StagedUpload, paths: Dict[str, str]):
+    loop = asyncio.get_running_loop()
+    derivatives = await loop.run_in_executor(_render_executor, _render_derivatives, staged.local_path)
+    await asyncio.gather(
+        storage.upload_staged(paths["original"], staged),
+        *[storage.upload(paths[name], data, "image/webp") for name, data in derivatives.items()],
+    )
+
+
+async def store_image(staged: storage.StagedUpload, refs: int = 1) -> dict:
+    """
+    Store an image under its content hash and take `refs` references on it.
+    Identical bytes uploaded again only bump the reference count.
+    Returns the fields to save on the product document.
+    """
+    paths = _paths(staged.sha256, staged.ext)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + RELEASE_WAIT_SECONDS
+    while True:
+        try:
+            # a record being deleted can't take new references; the upsert collides
+            # on _id until the release that owns it has removed it
+            before = await db.image.find_one_and_update(
+                {"_id": staged.sha256, "deleting": {"$exists": False}},
+                {
+                    "$inc": {"refs": refs},
+                    "$setOnInsert": {"paths": paths, "ready": False, "created_at": datetime.utcnow()},
+                },
+                upsert=True,
+                return_document=ReturnDocument.BEFORE,
+            )
+            break
+        except DuplicateKeyError:
+            if loop.time() >= deadline:
+                raise storage.StorageError("Image is still being deleted")
+            await asyncio.sleep(RELEASE_POLL_SECONDS)
+
+    if before is None or not before.get("ready"):
+        try:
+            await _upload_all(staged, paths)
+        except Exception as e:
+            await db.image.update_one({"_id": staged.sha256}, {"$inc": {"refs": -refs}})
+            raise storage.StorageError(str(e))
+        await db.image.update_one({"_id": staged.sha256}, {"$set": {"ready": True}})
+    else:
+        paths = before["paths"]
+
+    return {"image_hash": staged.sha256, **_urls(paths)}
+
+
+async def _release(query: dict, refs: int) -> bool:
+    doc = await db.image.find_one_and_update(
+        query,
+        {"$inc": {"refs": -refs}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc is None:
+        return False
+    if doc["refs"] <= 0:
+        # claim the deletion first: from here store_image can't revive the record,
+        # so the objects are removed before anything can point at them again
+        claimed = await db.image.update_one(
+            {"_id": doc["_id"], "refs": {"$lte": 0}, "deleting": {"$exists": False}},
+            {"$set": {"deleting": True}},
+        )
+        if claimed.modified_count:
+            try:
+                await storage.remove(list(doc["paths"].values()))
+            finally:
+                await db.image.delete_one({"_id": doc["_id"]})
+    return True
+
+
+async def release_image(file_path: str):
+    """
+    Drop one reference to the image stored at file_path; the objects are removed
+    from storage only when the last reference goes. Paths that predate the
+    content-addressed store are removed directly.
+    """
+    if not await _release({"paths.original": file_path}, 1):
+        await storage.remove([file_path])
+
+
+async def release_hash(image_hash: str, refs: int = 1):
+    """Give back references taken by store_image that ended up unused."""
+    await _release({"_id": image_hash}, refs)
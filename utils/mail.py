@@ -1,18 +1,12 @@
-from random import randint
-from fastapi_mail import FastMail, MessageSchema
-from utils.config import conf
-
-def generate_otp() -> str:
-    return str(randint(100000, 999999))
-
-async def send_otp_email(email: str, otp: str):
-
-    message = MessageSchema(
-        subject="Your Verification OTP",
-        recipients=[email],
-        body=f"Your OTP is: {otp}\nThis OTP will expire in 10 minutes.",
-        subtype="plain"
+from utils.email_outbox import enqueue_email
+from utils.settings import settings
+
+async def queue_otp_email(email: str, otp: str):
+    """Write the OTP email to the outbox; the outbox worker sends it."""
+    await enqueue_email(
+        email,
+        "Your Verification OTP",
+        f"Your OTP is: {otp}\nThis OTP will expire in {settings.otp_expire_minutes} minutes.",
+        # only db.otp's hash should outlive delivery
+        redact=True,
     )
-
-    fm = FastMail(conf)
-    await fm.send_message(message)
\ No newline at end of file
@@ -0,0 +1,93 @@
+import hashlib
+import hmac
+import secrets
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+from db.db import db
+from utils.mail import queue_otp_email
+from utils.settings import settings
+
+# purposes; admins live in db.user and verify through the user flow
+USER_VERIFY = "user_verify"
+SELLER_VERIFY = "seller_verify"
+USER_RESET = "user_reset"
+SELLER_RESET = "seller_reset"
+
+_KEY = settings.secret_key.get_secret_value().encode()
+
+
+def _otp_id(purpose: str, email: str) -> str:
+    return f"{purpose}:{email.strip().lower()}"
+
+
+def _hash(otp_id: str, code: str) -> str:
+    # keyed so a leaked collection can't be brute-forced over the 10^6 codes offline
+    return hmac.new(_KEY, f"{otp_id}:{code}".encode(), hashlib.sha256).hexdigest()
+
+
+def generate_otp() -> str:
+    return f"{secrets.randbelow(10 ** 6):06d}"
+
+
+async def issue(purpose: str, email: str) -> str:
+    """
+    Store a fresh code for (purpose, email), replacing any earlier one, and
+    return it. Raises 429 if the last code went out less than
+    OTP_RESEND_COOLDOWN_SECONDS ago.
+    """
+    otp_id = _otp_id(purpose, email)
+    code = generate_otp()
+    now = datetime.utcnow()
+    cooldown = timedelta(seconds=settings.otp_resend_cooldown_seconds)
+    try:
+        # the filter only matches a code older than the cooldown; a newer one
+        # makes the upsert collide on _id instead of overwriting it
+        await db.otp.update_one(
+            {"_id": otp_id, "sent_at": {"$lte": now - cooldown}},
+            {"$set": {
+                "code_hash": _hash(otp_id, code),
+                "attempts": 0,
+                "sent_at": now,
+                "expires_at": now + timedelta(minutes=settings.otp_expire_minutes),
+            }},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        current = await db.otp.find_one({"_id": otp_id}, {"sent_at": 1})
+        wait = (current["sent_at"] + cooldown - now).total_seconds() if current else 1
+        raise HTTPException(
+            status_code=429,
+            detail="Please wait before requesting another OTP",
+            headers={"Retry-After": str(max(1, int(wait + 0.999)))},
+        )
+    return code
+
+
+async def send(purpose: str, email: str):
+    """Issue a code and queue the email carrying it."""
+    code = await issue(purpose, email)
+    await queue_otp_email(email, code)
+
+
+async def verify(purpose: str, email: str, code: str) -> bool:
+    """
+    Consume the code if it matches, in one find_one_and_delete. A wrong guess
+    counts an attempt; after OTP_MAX_ATTEMPTS the code is gone and a new one
+    has to be requested.
+    """
+    otp_id = _otp_id(purpose, email)
+    doc = await db.otp.find_one_and_delete({
+        "_id": otp_id,
+        "code_hash": _hash(otp_id, code),
+        "expires_at": {"$gt": datetime.utcnow()},
+        "attempts": {"$lt": settings.otp_max_attempts},
+    })
+    if doc is not None:
+        return True
+
+    await db.otp.update_one({"_id": otp_id}, {"$inc": {"attempts": 1}})
+    await db.otp.delete_one({"_id": otp_id, "attempts": {"$gte": settings.otp_max_attempts}})
+    return False
@@ -0,0 +1,47 @@
+import base64
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from fastapi import HTTPException
+
+
+def encode_cursor(sort_value, last_id) -> str:
+    """Pack the (sort_key, _id) of the last row of a page into an opaque token."""
+    if isinstance(sort_value, datetime):
+        value = {"dt": sort_value.isoformat()}
+    elif isinstance(sort_value, ObjectId):
+        value = {"oid": str(sort_value)}
+    else:
+        value = {"v": sort_value}
+    raw = json.dumps({"k": value, "id": str(last_id)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        value = data["k"]
+        if "dt" in value:
+            sort_value = datetime.fromisoformat(value["dt"])
+        elif "oid" in value:
+            sort_value = ObjectId(value["oid"])
+        else:
+            sort_value = value["v"]
+        return sort_value, ObjectId(data["id"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def keyset_filter(field: str, direction: int, sort_value, last_id) -> dict:
+    """Match rows that come strictly after (sort_value, last_id) in the given order."""
+    op = "$gt" if direction > 0 else "$lt"
+    if field == "_id":
+        return {"_id": {op: last_id}}
+    return {
+        "$or": [
+            {field: {op: sort_value}},
+            {field: sort_value, "_id": {op: last_id}},
+        ]
+    }
@@ -0,0 +1,58 @@
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from utils.settings import settings
+
+PRINCIPAL_CACHE_SIZE = settings.principal_cache_size
+# also the longest a revoked token keeps working on a worker that didn't do the revoking
+PRINCIPAL_CACHE_TTL = settings.principal_cache_ttl
+
+
+class PrincipalCache:
+    """Bounded LRU of account documents keyed by the token's sub, with a TTL per entry."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, sub: str) -> Optional[dict]:
+        entry = self._data.get(sub)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[sub]
+            self.misses += 1
+            return None
+        self._data.move_to_end(sub)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, sub: str, account: dict):
+        self._data[sub] = (time.monotonic() + self.ttl, account)
+        self._data.move_to_end(sub)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, *subs):
+        for sub in subs:
+            self._data.pop(str(sub), None)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL)
@@ -0,0 +1,138 @@
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional
+
+from bson import ObjectId
+from db.db import db
+from utils.settings import settings
+
+
+class ProductCache:
+    """Bounded LRU cache of product documents keyed by str(_id), with a TTL per entry."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        # key -> [fetches in flight, invalidations seen]; lets a fetch tell that
+        # its document went stale while it was awaiting the database
+        self._fetching: Dict[str, list] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _lookup(self, key: str) -> Optional[dict]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, doc = entry
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return doc
+
+    def _store(self, doc: dict):
+        key = str(doc["_id"])
+        self._data[key] = (time.monotonic() + self.ttl, doc)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def _begin_fetch(self, keys) -> Dict[str, int]:
+        generations = {}
+        for key in keys:
+            entry = self._fetching.setdefault(key, [0, 0])
+            entry[0] += 1
+            generations[key] = entry[1]
+        return generations
+
+    def _end_fetch(self, generations: Dict[str, int]):
+        for key in generations:
+            entry = self._fetching[key]
+            entry[0] -= 1
+            if entry[0] == 0:
+                del self._fetching[key]
+
+    def _store_fetched(self, doc: dict, generations: Dict[str, int]):
+        """Cache a fetched document unless the product was invalidated during the fetch."""
+        key = str(doc["_id"])
+        if self._fetching[key][1] == generations[key]:
+            self._store(doc)
+
+    async def get(self, product_id) -> Optional[dict]:
+        key = str(product_id)
+        doc = self._lookup(key)
+        if doc is not None:
+            self.hits += 1
+            return dict(doc)
+
+        self.misses += 1
+        generations = self._begin_fetch([key])
+        try:
+            doc = await db.product.find_one({"_id": ObjectId(key)})
+            if doc is None:
+                return None
+            self._store_fetched(doc, generations)
+        finally:
+            self._end_fetch(generations)
+        return dict(doc)
+
+    async def get_many(self, product_ids: Iterable) -> Dict[str, dict]:
+        """Resolve many ids with at most one $in query for the misses. Invalid ids are skipped."""
+        found: Dict[str, dict] = {}
+        missing = []
+        seen = set()
+        for pid in product_ids:
+            key = str(pid)
+            if key in seen:
+                continue
+            seen.add(key)
+            doc = self._lookup(key)
+            if doc is not None:
+                self.hits += 1
+                found[key] = dict(doc)
+            elif ObjectId.is_valid(key):
+                self.misses += 1
+                missing.append(ObjectId(key))
+
+        if missing:
+            generations = self._begin_fetch(str(oid) for oid in missing)
+            try:
+                docs = await db.product.find({"_id": {"$in": missing}}).to_list(length=None)
+                for doc in docs:
+                    self._store_fetched(doc, generations)
+                    found[str(doc["_id"])] = dict(doc)
+            finally:
+                self._end_fetch(generations)
+        return found
+
+    def invalidate(self, *product_ids):
+        for pid in product_ids:
+            key = str(pid)
+            self._data.pop(key, None)
+            entry = self._fetching.get(key)
+            if entry is not None:
+                entry[1] += 1
+
+    def clear(self):
+        self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+product_cache = ProductCache(
+    maxsize=settings.product_cache_size,
+    ttl=settings.product_cache_ttl,
+)
@@ -0,0 +1,140 @@
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from fastapi import HTTPException, Request
+from pymongo import ReturnDocument
+
+from db.db import db
+from utils.settings import settings
+
+# route -> {"ip": "N/seconds", "account": "N/seconds"}; override any entry with
+# RATE_LIMITS='{"user_login:account": "3/60"}'
+ROUTE_LIMITS = {
+    "user_login": {"ip": "30/60", "account": "5/60"},
+    "seller_login": {"ip": "30/60", "account": "5/60"},
+    "admin_login": {"ip": "10/60", "account": "5/300"},
+    "user_verify_otp": {"ip": "30/60", "account": "5/300"},
+    "seller_verify_otp": {"ip": "30/60", "account": "5/300"},
+    "user_reset_verify": {"ip": "30/60", "account": "5/300"},
+    "seller_reset_verify": {"ip": "30/60", "account": "5/300"},
+}
+
+RATE_LIMIT_STATS = {
+    "allowed": 0,
+    "rejected": 0,
+}
+
+
+def parse_limit(spec: str) -> Tuple[int, float]:
+    count, _, seconds = spec.partition("/")
+    return int(count), float(seconds)
+
+
+def _limit_for(route: str, kind: str) -> Optional[Tuple[int, float]]:
+    spec = settings.rate_limits.get(f"{route}:{kind}") or ROUTE_LIMITS.get(route, {}).get(kind)
+    return parse_limit(spec) if spec else None
+
+
+class TokenBuckets:
+    """Per-key token buckets in process memory; least recently used keys are dropped past maxsize."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+
+    def take(self, key: str, capacity: int, period: float) -> float:
+        """Take one token; returns 0 when allowed, else seconds until one is available."""
+        now = time.monotonic()
+        rate = capacity / period
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [float(capacity), now]
+            self._buckets[key] = bucket
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / rate
+
+
+_buckets = TokenBuckets(settings.rate_limit_max_keys)
+
+
+async def _take_shared(key: str, capacity: int, period: float) -> float:
+    """Fixed-window counter in db.rate_limit, shared by every worker; windows expire via TTL."""
+    now = time.time()
+    window = int(now // period)
+    window_end = (window + 1) * period
+    doc = await db.rate_limit.find_one_and_update(
+        {"_id": f"{key}:{window}"},
+        {
+            "$inc": {"count": 1},
+            "$setOnInsert": {"expires_at": datetime.utcfromtimestamp(window_end) + timedelta(seconds=period)},
+        },
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    if doc["count"] <= capacity:
+        return 0.0
+    return window_end - now
+
+
+def client_ip(request: Request) -> str:
+    if settings.rate_limit_trust_forwarded:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+async def check(route: str, request: Request, account: Optional[str] = None):
+    """
+    Count one attempt against the route's IP and account limits and raise 429
+    with Retry-After when either is used up. Call it first in the handler,
+    before any password hashing or account lookup.
+    """
+    if not settings.rate_limit_enabled:
+        return
+
+    keys: Dict[str, str] = {"ip": client_ip(request)}
+    if account:
+        keys["account"] = str(account).strip().lower()
+
+    retry_after = 0.0
+    for kind, value in keys.items():
+        limit = _limit_for(route, kind)
+        if limit is None:
+            continue
+        key = f"{route}:{kind}:{value}"
+        if settings.rate_limit_backend == "mongo":
+            wait = await _take_shared(key, *limit)
+        else:
+            wait = _buckets.take(key, *limit)
+        retry_after = max(retry_after, wait)
+
+    if retry_after > 0:
+        RATE_LIMIT_STATS["rejected"] += 1
+        raise HTTPException(
+            status_code=429,
+            detail="Too many attempts, try again later",
+            headers={"Retry-After": str(max(1, int(retry_after + 0.999)))},
+        )
+    RATE_LIMIT_STATS["allowed"] += 1
+
+
+def stats() -> dict:
+    return {
+        "enabled": settings.rate_limit_enabled,
+        "backend": settings.rate_limit_backend,
+        **RATE_LIMIT_STATS,
+        # in-process buckets only; the mongo backend keeps its windows in db.rate_limit
+        "tracked_keys": len(_buckets._buckets),
+    }
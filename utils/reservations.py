@@ -0,0 +1,222 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from bson import ObjectId
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from db.db import db
+from utils.settings import settings
+from utils.product_cache import product_cache
+
+RESERVATION_TTL_SECONDS = settings.reservation_ttl_seconds
+RESERVATION_SWEEP_SECONDS = settings.reservation_sweep_seconds
+RESERVATION_SWEEP_BATCH = settings.reservation_sweep_batch
+
+RESERVATION_STATS = {
+    "holds": 0,
+    "shortfalls": 0,
+    "consumed": 0,
+    "released": 0,
+    "expired": 0,
+}
+
+_sweeper = None
+
+
+async def _adjust_stock(pid: str, delta: int) -> bool:
+    """Take (delta > 0) or give back (delta < 0) stock on the product document."""
+    if delta > 0:
+        res = await db.product.update_one(
+            {"_id": ObjectId(pid), "stock": {"$gte": delta}},
+            {"$inc": {"stock": -delta}},
+        )
+        ok = res.modified_count == 1
+    else:
+        await db.product.update_one({"_id": ObjectId(pid)}, {"$inc": {"stock": -delta}})
+        ok = True
+    product_cache.invalidate(pid)
+    return ok
+
+
+async def _restock(held: Dict[str, int]):
+    ops = [UpdateOne({"_id": ObjectId(pid)}, {"$inc": {"stock": qty}}) for pid, qty in held.items() if qty > 0]
+    if ops:
+        await db.product.bulk_write(ops, ordered=False)
+        product_cache.invalidate(*held.keys())
+
+
+async def hold(user_id, pid: str, qty: int) -> bool:
+    """
+    Hold qty units of a product for this user until the hold expires.
+    Held units are taken out of product.stock right away, so checkout only
+    has to drop the hold. A second call adjusts the hold to the new quantity.
+    """
+    expires_at = datetime.utcnow() + timedelta(seconds=RESERVATION_TTL_SECONDS)
+    while True:
+        current = await db.reservation.find_one({"user": user_id, "item_id": pid})
+        have = current["quantity"] if current else 0
+        delta = qty - have
+
+        # stock is taken before the hold records it, so a hold never claims more
+        # than is actually out of stock; a shrinking hold gives units back after
+        if delta > 0 and not await _adjust_stock(pid, delta):
+            RESERVATION_STATS["shortfalls"] += 1
+            return False
+
+        # compare-and-set on the held quantity so concurrent calls can't both apply a delta
+        if current:
+            res = await db.reservation.update_one(
+                {"_id": current["_id"], "quantity": have},
+                {"$set": {"quantity": qty, "expires_at": expires_at}},
+            )
+            recorded = res.modified_count == 1
+        else:
+            try:
+                await db.reservation.insert_one({
+                    "user": user_id,
+                    "item_id": pid,
+                    "quantity": qty,
+                    "expires_at": expires_at,
+                    "created_at": datetime.utcnow(),
+                })
+                recorded = True
+            except DuplicateKeyError:
+                recorded = False
+
+        if not recorded:
+            # lost the race to another hold/consume: undo our take and look again
+            if delta > 0:
+                await _adjust_stock(pid, -delta)
+            continue
+
+        if delta < 0:
+            await _adjust_stock(pid, delta)
+        if delta:
+            RESERVATION_STATS["holds"] += 1
+        return True
+
+
+async def active_holds(user_id) -> Dict[str, int]:
+    docs = await db.reservation.find(
+        {"user": user_id, "expires_at": {"$gt": datetime.utcnow()}},
+        {"item_id": 1, "quantity": 1},
+    ).to_list(length=None)
+    return {d["item_id"]: d["quantity"] for d in docs}
+
+
+async def consume(user_id, pids: List[str], session=None) -> Dict[str, int]:
+    """
+    Drop the user's unexpired holds on these products and return what they held.
+    The held units are already out of stock; the caller now owns them and must
+    put them back (or decrement the rest) itself.
+    """
+    now = datetime.utcnow()
+    held = {}
+    for pid in pids:
+        doc = await db.reservation.find_one_and_delete(
+            {"user": user_id, "item_id": pid, "expires_at": {"$gt": now}},
+            session=session,
+        )
+        if doc:
+            held[pid] = doc["quantity"]
+    if held:
+        RESERVATION_STATS["consumed"] += len(held)
+    return held
+
+
+async def restore(user_id, held: Dict[str, int]):
+    """
+    Put back holds that consume() dropped for a checkout that then failed.
+    The units never left the user, so stock is untouched; a hold taken again
+    in the meantime is merged.
+    """
+    expires_at = datetime.utcnow() + timedelta(seconds=RESERVATION_TTL_SECONDS)
+    for pid, qty in held.items():
+        for _ in range(2):
+            try:
+                await db.reservation.update_one(
+                    {"user": user_id, "item_id": pid},
+                    {
+                        "$inc": {"quantity": qty},
+                        "$max": {"expires_at": expires_at},
+                        "$setOnInsert": {"created_at": datetime.utcnow()},
+                    },
+                    upsert=True,
+                )
+                break
+            except DuplicateKeyError:
+                # a concurrent upsert created it first; the retry updates it
+                continue
+    if held:
+        RESERVATION_STATS["consumed"] -= len(held)
+
+
+async def release(user_id) -> int:
+    """Give back every hold the user has (checkout cancelled or finished with leftovers)."""
+    released: Dict[str, int] = {}
+    count = 0
+    for doc in await db.reservation.find({"user": user_id}, {"_id": 1}).to_list(length=None):
+        gone = await db.reservation.find_one_and_delete({"_id": doc["_id"]})
+        if gone:
+            released[gone["item_id"]] = released.get(gone["item_id"], 0) + gone["quantity"]
+            count += 1
+    await _restock(released)
+    RESERVATION_STATS["released"] += count
+    return count
+
+
+def split_against_holds(stock_updates: List[Tuple[str, int]], held: Dict[str, int]):
+    """(still to decrement, to give back) once consumed holds are counted."""
+    need, surplus = [], []
+    for pid, qty in stock_updates:
+        diff = qty - held.get(pid, 0)
+        if diff > 0:
+            need.append((pid, diff))
+        elif diff < 0:
+            surplus.append((pid, -diff))
+    return need, surplus
+
+
+async def sweep_expired() -> int:
+    """Delete expired holds one by one and return their units to stock."""
+    now = datetime.utcnow()
+    expired = await db.reservation.find(
+        {"expires_at": {"$lte": now}}, {"_id": 1}
+    ).limit(RESERVATION_SWEEP_BATCH).to_list(length=None)
+
+    restored: Dict[str, int] = {}
+    count = 0
+    for doc in expired:
+        # only the deleter restores, so a hold consumed or renewed meanwhile is left alone
+        gone = await db.reservation.find_one_and_delete({"_id": doc["_id"], "expires_at": {"$lte": now}})
+        if gone:
+            restored[gone["item_id"]] = restored.get(gone["item_id"], 0) + gone["quantity"]
+            count += 1
+    await _restock(restored)
+    RESERVATION_STATS["expired"] += count
+    return count
+
+
+async def _sweep_loop():
+    while True:
+        try:
+            await sweep_expired()
+        except Exception as e:
+            print("Reservation sweep error:", e)
+        await asyncio.sleep(RESERVATION_SWEEP_SECONDS)
+
+
+def start_sweeper():
+    global _sweeper
+    if _sweeper is None:
+        _sweeper = asyncio.create_task(_sweep_loop())
+
+
+async def stop_sweeper():
+    global _sweeper
+    if _sweeper is not None:
+        _sweeper.cancel()
+        await asyncio.gather(_sweeper, return_exceptions=True)
+        _sweeper = None
@@ -1,16 +1,49 @@
 from passlib.context import CryptContext
-from typing import Optional
+from typing import Optional, Tuple
 from jose import jwt
 # pip install python-jose[cryptography]
 from datetime import timedelta,datetime
-import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import asyncio
+import time
 from db.db import db
+from utils.settings import settings
 from fastapi import Depends, HTTPException
 from fastapi.security import  HTTPBearer, HTTPAuthorizationCredentials
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+BCRYPT_ROUNDS = settings.bcrypt_rounds
+# hashes below BCRYPT_ROUNDS are reported by verify_and_update so login can upgrade them
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+)
 auth_scheme = HTTPBearer()
 
+SECRET_KEY = settings.secret_key.get_secret_value()
+ALGORITHM = settings.algorithm
+ACCESS_TOKEN_EXPIRE = timedelta(minutes=settings.access_token_expire_minutes)
+
+# bcrypt runs off the event loop: "thread" (bcrypt releases the GIL) or "process"
+PASSWORD_HASH_EXECUTOR = settings.password_hash_executor
+PASSWORD_HASH_WORKERS = settings.password_hash_workers
+# 0 = no limit; past this many waiting hashes new ones get a 503 instead of queueing
+PASSWORD_HASH_MAX_QUEUE = settings.password_hash_max_queue
+PASSWORD_REHASH_ON_LOGIN = settings.password_rehash_on_login
+
+_hash_pool = None
+_hash_slots = None
+_hash_waits = deque(maxlen=1000)
+HASH_STATS = {
+    "queued": 0,
+    "running": 0,
+    "completed": 0,
+    "rejected": 0,
+    "max_queue_depth": 0,
+}
+
 def hash_password(password: str) -> str:
     if not password:
         raise ValueError("Password Cannot Be Empty Or None")
@@ -23,19 +56,92 @@ def hash_password(password: str) -> str:
 def verify_password(plain_password,hashed_password):
     return pwd_context.verify(plain_password,hashed_password)
 
+def _verify_and_update(plain_password, hashed_password):
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+def _get_hash_pool():
+    global _hash_pool, _hash_slots
+    if _hash_pool is None:
+        if PASSWORD_HASH_EXECUTOR == "process":
+            _hash_pool = ProcessPoolExecutor(max_workers=PASSWORD_HASH_WORKERS)
+        else:
+            _hash_pool = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+        _hash_slots = asyncio.Semaphore(PASSWORD_HASH_WORKERS)
+    return _hash_pool, _hash_slots
+
+async def _run_hash(fn, *args):
+    """Run a bcrypt call on the pool, at most PASSWORD_HASH_WORKERS at a time."""
+    pool, slots = _get_hash_pool()
+    if PASSWORD_HASH_MAX_QUEUE and HASH_STATS["queued"] >= PASSWORD_HASH_MAX_QUEUE:
+        HASH_STATS["rejected"] += 1
+        raise HTTPException(status_code=503, detail="Server busy, try again", headers={"Retry-After": "1"})
+
+    HASH_STATS["queued"] += 1
+    HASH_STATS["max_queue_depth"] = max(HASH_STATS["max_queue_depth"], HASH_STATS["queued"])
+    start = time.monotonic()
+    try:
+        await slots.acquire()
+    finally:
+        HASH_STATS["queued"] -= 1
+    _hash_waits.append(time.monotonic() - start)
+
+    HASH_STATS["running"] += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(pool, fn, *args)
+    finally:
+        HASH_STATS["running"] -= 1
+        HASH_STATS["completed"] += 1
+        slots.release()
+
+async def hash_password_async(password: str) -> str:
+    return await _run_hash(hash_password, password)
+
+async def verify_and_update_async(plain_password, hashed_password) -> Tuple[bool, Optional[str]]:
+    """
+    (valid, new_hash). new_hash is set only when PASSWORD_REHASH_ON_LOGIN is on
+    and the stored hash uses fewer rounds than BCRYPT_ROUNDS; save it in place.
+    """
+    valid, new_hash = await _run_hash(_verify_and_update, plain_password, hashed_password)
+    return valid, (new_hash if valid and PASSWORD_REHASH_ON_LOGIN else None)
+
+def password_hash_stats() -> dict:
+    waits = sorted(_hash_waits)
+    p99 = waits[min(len(waits) - 1, int(0.99 * len(waits)))] if waits else 0.0
+    return {
+        "executor": PASSWORD_HASH_EXECUTOR,
+        "workers": PASSWORD_HASH_WORKERS,
+        "rounds": BCRYPT_ROUNDS,
+        **HASH_STATS,
+        "queue_wait_p99_ms": p99 * 1000,
+    }
+
+def shutdown_hash_pool():
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown(wait=False)
+        _hash_pool = None
+
+def principal_claims(account: dict) -> dict:
+    """JWT claims for an account: sub/role/tv let chk_* resolve it without a lookup by email."""
+    return {
+        "email": account["email"],
+        "sub": str(account["_id"]),
+        "role": account.get("role"),
+        "tv": account.get("token_version", 0),
+    }
+
 def create_access_token(data:dict,expires_delta:Optional[timedelta] = None):
     try:
         to_encode = data.copy()
-        ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES"))
-        expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+        expire = datetime.utcnow() + (expires_delta or ACCESS_TOKEN_EXPIRE)
         to_encode.update({"exp":expire})
-        return jwt.encode(to_encode,os.getenv("SECRET_KEY"),algorithm=os.getenv("ALGORITHM"))
+        return jwt.encode(to_encode,SECRET_KEY,algorithm=ALGORITHM)
     except Exception as e:
         return str(e)
 
 def decode_access_token(token:str):
     try:
-        return jwt.decode(token,os.getenv("SECRET_KEY"),algorithm=os.getenv("ALGORITHM"))
+        return jwt.decode(token,SECRET_KEY,algorithms=ALGORITHM)
     except Exception as e:
         return None
     
@@ -43,10 +149,10 @@ def decode_access_token(token:str):
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)):
     token = credentials.credentials
     try:
-        payload = jwt.decode(token,os.getenv("SECRET_KEY"), algorithms=os.getenv("ALGORITHM"))
+        payload = jwt.decode(token,SECRET_KEY, algorithms=ALGORITHM)
         email = payload.get("email")
         if email is None:
             raise HTTPException(status_code=401, detail="Invalid token")
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
-    return {"email": email}
\ No newline at end of file
+    return {"email": email, "sub": payload.get("sub"), "role": payload.get("role"), "tv": payload.get("tv", 0)}
@@ -0,0 +1,94 @@
+import os
+from functools import lru_cache
+from typing import Dict, Literal, Optional
+
+from pydantic import Field, SecretStr
+from pydantic_settings import BaseSettings, SettingsConfigDict
+
+
+class Settings(BaseSettings):
+    """
+    Every environment knob in one place, read from the environment / .env once.
+    Fields without a default are required: a missing one stops the app at
+    startup instead of failing the first request that needs it.
+    """
+
+    model_config = SettingsConfigDict(env_file=".env", extra="ignore")
+
+    # ---------- database / storage ----------
+    db_uri: str
+    supabase_url: str
+    supabase_service_role_key: SecretStr
+    storage_max_concurrency: int = 8
+    storage_timeout_seconds: float = 30
+    max_image_bytes: int = 5 * 1024 * 1024
+    # decoded size is what costs memory; 25 MP is ~100 MB as RGBA
+    max_image_pixels: int = 25_000_000
+    image_render_workers: int = 2
+
+    # ---------- auth ----------
+    secret_key: SecretStr
+    algorithm: str
+    access_token_expire_minutes: int
+    admin_secret_key: Optional[SecretStr] = None
+    otp_expire_minutes: int = 10
+    otp_resend_cooldown_seconds: int = 60
+    otp_max_attempts: int = 5
+    bcrypt_rounds: int = 12
+    password_hash_executor: Literal["thread", "process"] = "thread"
+    password_hash_workers: int = Field(default_factory=lambda: os.cpu_count() or 2)
+    password_hash_max_queue: int = 0
+    password_rehash_on_login: bool = False
+    principal_cache_size: int = 10000
+    principal_cache_ttl: float = 60
+    rate_limit_enabled: bool = True
+    # "mongo" shares counters across workers at the cost of one write per attempt
+    rate_limit_backend: Literal["memory", "mongo"] = "memory"
+    rate_limit_max_keys: int = 100000
+    rate_limit_trust_forwarded: bool = False
+    rate_limits: Dict[str, str] = {}
+
+    # ---------- mail ----------
+    mail: str
+    mail_password: SecretStr
+    mail_from: str = "donharsh1011@gmail.com"
+    mail_port: int = 587
+    mail_server: str = "smtp.gmail.com"
+    mail_starttls: bool = True
+    mail_ssl_tls: bool = False
+    use_credentials: bool = True
+    smtp_pool_size: int = 3
+    smtp_keepalive_seconds: float = 30
+    smtp_timeout_seconds: float = 20
+    email_outbox_worker: Literal["inprocess", "standalone"] = "inprocess"
+    outbox_concurrency: int = 4
+    outbox_max_attempts: int = 6
+    outbox_poll_seconds: float = 2
+    outbox_lease_seconds: int = 60
+    outbox_backoff_seconds: float = 5
+    outbox_backoff_max_seconds: float = 900
+
+    # ---------- catalog / checkout ----------
+    product_cache_size: int = 5000
+    product_cache_ttl: float = 30
+    category_version_check_seconds: float = 5
+    search_facet_cache_seconds: float = 300
+    import_batch_size: int = 1000
+    import_image_concurrency: Optional[int] = None
+    checkout_transactions: bool = False
+    reservation_ttl_seconds: int = 600
+    reservation_sweep_seconds: float = 15
+    reservation_sweep_batch: int = 500
+    idempotency_ttl_seconds: int = 24 * 3600
+    idempotency_lock_seconds: int = 60
+    idempotency_wait_seconds: float = 30
+    idempotency_poll_seconds: float = 0.2
+
+
+@lru_cache
+def get_settings() -> Settings:
+    """The one Settings instance; also usable as a route dependency."""
+    return Settings()
+
+
+settings = get_settings()
@@ -0,0 +1,163 @@
+import asyncio
+import time
+from collections import deque
+from email.message import EmailMessage
+from typing import Optional
+
+import aiosmtplib
+
+from utils.config import conf
+from utils.settings import settings
+
+SMTP_POOL_SIZE = settings.smtp_pool_size
+SMTP_KEEPALIVE_SECONDS = settings.smtp_keepalive_seconds
+SMTP_TIMEOUT_SECONDS = settings.smtp_timeout_seconds
+
+
+def build_message(to_email: str, subject: str, body: str, subtype: str = "plain", text_body: Optional[str] = None) -> EmailMessage:
+    """Plain messages get one part; HTML messages get a text/plain alternative first."""
+    message = EmailMessage()
+    message["From"] = conf.MAIL_FROM
+    message["To"] = to_email
+    message["Subject"] = subject
+    if subtype == "html":
+        message.set_content(text_body or "This email is best viewed in an HTML capable client.")
+        message.add_alternative(body, subtype="html")
+    else:
+        message.set_content(body)
+    return message
+
+
+class SMTPPool:
+    """
+    A few authenticated SMTP connections reused across messages.
+    Connections idle longer than SMTP_KEEPALIVE_SECONDS are NOOP-checked before
+    reuse; a connection that errors is dropped and the send retried on a new one.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self._idle: asyncio.Queue = asyncio.Queue()
+        self._open = 0
+        # one slot per connection in use; idle plus in-use connections never exceed size
+        self._slots = asyncio.Semaphore(size)
+        self.sent = 0
+        self.failed = 0
+        self.connects = 0
+        self.reconnects = 0
+        self._latencies = deque(maxlen=1000)
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        client = aiosmtplib.SMTP(
+            hostname=conf.MAIL_SERVER,
+            port=conf.MAIL_PORT,
+            use_tls=conf.MAIL_SSL_TLS,
+            start_tls=conf.MAIL_STARTTLS,
+            timeout=SMTP_TIMEOUT_SECONDS,
+        )
+        await client.connect()
+        if conf.USE_CREDENTIALS:
+            await client.login(conf.MAIL_USERNAME, conf.MAIL_PASSWORD.get_secret_value())
+        self.connects += 1
+        return client
+
+    async def _acquire(self):
+        """
+        Wait for a slot, then reuse an idle connection or open a new one. With
+        a slot held and nothing idle, every other connection is in use, so a
+        new one stays within size. Handshakes run outside any lock.
+        """
+        await self._slots.acquire()
+        try:
+            while True:
+                try:
+                    client, last_used = self._idle.get_nowait()
+                except asyncio.QueueEmpty:
+                    client = await self._connect()
+                    self._open += 1
+                    return client
+
+                if time.monotonic() - last_used < SMTP_KEEPALIVE_SECONDS:
+                    return client
+                try:
+                    await client.noop()
+                    return client
+                except Exception:
+                    self._close(client)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, client):
+        self._idle.put_nowait((client, time.monotonic()))
+        self._slots.release()
+
+    def _close(self, client):
+        self._open -= 1
+        try:
+            client.close()
+        except Exception:
+            pass
+
+    def _discard(self, client):
+        self._close(client)
+        self._slots.release()
+
+    async def send(self, message: EmailMessage):
+        start = time.monotonic()
+        client = await self._acquire()
+        try:
+            await client.send_message(message)
+        except (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, ConnectionError, asyncio.TimeoutError):
+            # stale connection: drop it and retry once on a fresh one
+            self._discard(client)
+            self.reconnects += 1
+            try:
+                client = await self._acquire()
+            except Exception:
+                self.failed += 1
+                raise
+            try:
+                await client.send_message(message)
+            except Exception:
+                self.failed += 1
+                self._discard(client)
+                raise
+        except Exception:
+            self.failed += 1
+            self._release(client)
+            raise
+
+        self._release(client)
+        self.sent += 1
+        self._latencies.append(time.monotonic() - start)
+
+    async def close(self):
+        while not self._idle.empty():
+            client, _ = self._idle.get_nowait()
+            try:
+                await client.quit()
+            except Exception:
+                client.close()
+            self._open -= 1
+
+    def stats(self) -> dict:
+        latencies = sorted(self._latencies)
+
+        def pct(p):
+            return latencies[min(len(latencies) - 1, int(p * len(latencies)))] if latencies else 0.0
+
+        return {
+            "pool_size": self.size,
+            "open_connections": self._open,
+            "idle_connections": self._idle.qsize(),
+            "sent": self.sent,
+            "failed": self.failed,
+            "connects": self.connects,
+            "reconnects": self.reconnects,
+            "latency_p50_ms": pct(0.5) * 1000,
+            "latency_p99_ms": pct(0.99) * 1000,
+        }
+
+
+smtp_pool = SMTPPool(SMTP_POOL_SIZE)
@@ -0,0 +1,194 @@
+import asyncio
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import partial
+from typing import List, Optional, Tuple
+
+from PIL import Image
+
+from db.db import supabase
+from utils.settings import settings
+
+BUCKET = "product-image"
+
+STORAGE_MAX_CONCURRENCY = settings.storage_max_concurrency
+STORAGE_TIMEOUT_SECONDS = settings.storage_timeout_seconds
+MAX_IMAGE_BYTES = settings.max_image_bytes
+MAX_IMAGE_PIXELS = settings.max_image_pixels
+CHUNK_SIZE = 64 * 1024
+
+# magic bytes -> (content type, extension)
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", ("image/jpeg", "jpg")),
+    (b"\x89PNG\r\n\x1a\n", ("image/png", "png")),
+    (b"GIF87a", ("image/gif", "gif")),
+    (b"GIF89a", ("image/gif", "gif")),
+]
+
+# supabase-py is synchronous; its calls run here so they never block the event loop
+_executor = ThreadPoolExecutor(max_workers=STORAGE_MAX_CONCURRENCY, thread_name_prefix="storage")
+_semaphore = asyncio.Semaphore(STORAGE_MAX_CONCURRENCY)
+
+
+class StorageError(Exception):
+    pass
+
+
+class UploadRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+@dataclass
+class StagedUpload:
+    """An upload copied to a local temp file; only one chunk was ever held in memory."""
+    local_path: str
+    size: int
+    content_type: str
+    ext: str
+    sha256: str
+
+    def cleanup(self):
+        try:
+            os.remove(self.local_path)
+        except OSError:
+            pass
+
+
+def sniff_image_type(head: bytes) -> Optional[Tuple[str, str]]:
+    for signature, kind in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return kind
+    if len(head) >= 12 and head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return ("image/webp", "webp")
+    return None
+
+
+def _check_dimensions(local_path: str):
+    """Read only the header: a small file can still decode to gigabytes."""
+    too_large = UploadRejected(413, f"Image larger than {MAX_IMAGE_PIXELS} pixels")
+    try:
+        with Image.open(local_path) as img:
+            width, height = img.size
+    except Image.DecompressionBombError:
+        raise too_large
+    except Exception:
+        raise UploadRejected(400, "Unreadable image file")
+    if width * height > MAX_IMAGE_PIXELS:
+        raise too_large
+
+
+def _stage_sync(fileobj, max_bytes: int) -> StagedUpload:
+    fd, local_path = tempfile.mkstemp(prefix="upload-")
+    size = 0
+    kind = None
+    digest = hashlib.sha256()
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = fileobj.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if kind is None:
+                    kind = sniff_image_type(chunk)
+                    if kind is None:
+                        raise UploadRejected(400, "Only image files allowed")
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadRejected(413, f"Image larger than {max_bytes} bytes")
+                digest.update(chunk)
+                out.write(chunk)
+        if kind is None:
+            raise UploadRejected(400, "Empty image file")
+        _check_dimensions(local_path)
+    except BaseException:
+        os.remove(local_path)
+        raise
+    return StagedUpload(
+        local_path=local_path,
+        size=size,
+        content_type=kind[0],
+        ext=kind[1],
+        sha256=digest.hexdigest(),
+    )
+
+
+async def stage_upload(photo, max_bytes: int = MAX_IMAGE_BYTES) -> StagedUpload:
+    """
+    Copy an UploadFile to a temp file in CHUNK_SIZE pieces, rejecting it as soon
+    as it crosses max_bytes. The content type comes from the file's magic bytes.
+    """
+    if photo.size is not None and photo.size > max_bytes:
+        raise UploadRejected(413, f"Image larger than {max_bytes} bytes")
+    return await stage_fileobj(photo.file, max_bytes)
+
+
+async def stage_fileobj(fileobj, max_bytes: int = MAX_IMAGE_BYTES) -> StagedUpload:
+    """Same as stage_upload for any blocking binary file object (e.g. a zip member)."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, _stage_sync, fileobj, max_bytes)
+
+
+async def _run(fn, *args, timeout: float = STORAGE_TIMEOUT_SECONDS):
+    async with _semaphore:
+        loop = asyncio.get_running_loop()
+        try:
+            return await asyncio.wait_for(loop.run_in_executor(_executor, partial(fn, *args)), timeout)
+        except asyncio.TimeoutError:
+            raise StorageError(f"storage call timed out after {timeout}s")
+
+
+async def upload(file_path: str, data, content_type: str):
+    try:
+        res = await _run(
+            supabase.storage.from_(BUCKET).upload,
+            file_path,
+            data,
+            {"content-type": content_type, "upsert": "true"},
+        )
+    except StorageError:
+        raise
+    except Exception as e:
+        raise StorageError(str(e))
+    if isinstance(res, dict) and res.get("error"):
+        raise StorageError(str(res["error"]))
+    return res
+
+
+def _upload_local_file(file_path: str, local_path: str, content_type: str):
+    # an open file handle is streamed by the storage client instead of being read into memory
+    with open(local_path, "rb") as f:
+        return supabase.storage.from_(BUCKET).upload(
+            file_path, f, {"content-type": content_type, "upsert": "true"}
+        )
+
+
+async def upload_staged(file_path: str, staged: StagedUpload):
+    try:
+        res = await _run(_upload_local_file, file_path, staged.local_path, staged.content_type)
+    except StorageError:
+        raise
+    except Exception as e:
+        raise StorageError(str(e))
+    if isinstance(res, dict) and res.get("error"):
+        raise StorageError(str(res["error"]))
+    return res
+
+
+def public_url(file_path: str) -> str:
+    # pure URL building in supabase-py, no network round-trip
+    return str(supabase.storage.from_(BUCKET).get_public_url(file_path))
+
+
+async def remove(file_paths: List[str]):
+    try:
+        return await _run(supabase.storage.from_(BUCKET).remove, file_paths)
+    except StorageError:
+        raise
+    except Exception as e:
+        raise StorageError(str(e))
@@ -1,23 +1,86 @@
 from db.db import db
 from bson import ObjectId
+from pymongo import ReturnDocument
 
 
 async def cart_total_save(user_id):
+    """Recompute the cart header from every cart line. Used to repair drift."""
     try:
-        cart_items = await db.cart.find({"user": ObjectId(user_id)}).to_list(length=None)
+        rows = await db.cart.aggregate([
+            {"$match": {"user": ObjectId(user_id)}},
+            {"$group": {
+                "_id": None,
+                "total": {"$sum": {"$multiply": [{"$toDouble": {"$ifNull": ["$price", 0]}}, {"$toDouble": {"$ifNull": ["$quantity", 0]}}]}},
+                "final": {"$sum": {"$multiply": [{"$toDouble": {"$ifNull": ["$final_price", 0]}}, {"$toDouble": {"$ifNull": ["$quantity", 0]}}]}},
+            }},
+        ]).to_list(length=1)
 
-        total = 0.0
-        final = 0.0
-
-        for item in cart_items:
-            price = float(item.get("price", 0))
-            f_price = float(item.get("final_price", 0))
-            qty = float(item.get("quantity", 0))
-
-            total += price * qty
-            final += f_price * qty
+        total = float(rows[0]["total"]) if rows else 0.0
+        final = float(rows[0]["final"]) if rows else 0.0
 
+        await db.cart_total.update_one(
+            {"_id": ObjectId(user_id)},
+            {"$set": {"total": total, "final_total": final}},
+            upsert=True,
+        )
         return total, final
 
     except Exception as e:
         raise Exception(str(e))
+
+
+async def apply_cart_delta(user_id, total_delta: float, final_delta: float):
+    """
+    Move the running cart totals by the change one line mutation made.
+    Carts without a header yet (older carts) get one computed from their lines,
+    which already include the mutation.
+    """
+    header = await db.cart_total.find_one_and_update(
+        {"_id": ObjectId(user_id)},
+        {"$inc": {"total": float(total_delta), "final_total": float(final_delta)}},
+        return_document=ReturnDocument.AFTER,
+    )
+    if header is None:
+        return await cart_total_save(user_id)
+    return header["total"], header["final_total"]
+
+
+def line_totals(line) -> tuple:
+    """(price * qty, final_price * qty) for one cart line document, or zeros for None."""
+    if not line:
+        return 0.0, 0.0
+    qty = float(line.get("quantity", 0))
+    return float(line.get("price", 0)) * qty, float(line.get("final_price", 0)) * qty
+
+
+async def verify_cart_total(user_id, tolerance: float = 0.01) -> dict:
+    """Compare the running totals with a full recompute and repair them if they drifted."""
+    header = await db.cart_total.find_one({"_id": ObjectId(user_id)}) or {}
+    total, final = await cart_total_save(user_id)
+    drift_total = total - float(header.get("total", 0.0))
+    drift_final = final - float(header.get("final_total", 0.0))
+    return {
+        "total": total,
+        "with_discount": final,
+        "drift": {"total": drift_total, "with_discount": drift_final},
+        "drifted": abs(drift_total) > tolerance or abs(drift_final) > tolerance,
+    }
+
+
+async def clear_cart_total(user_id):
+    await db.cart_total.delete_one({"_id": ObjectId(user_id)})
+
+
+def parse_discount(value) -> float:
+    """Discounts are stored as strings like "10%"; return the number."""
+    try:
+        return float(str(value if value is not None else 0).rstrip("%"))
+    except Exception:
+        return 0.0
+
+
+def compute_final_price(price, discount) -> float:
+    try:
+        return float(price) - ((float(price) * parse_discount(discount)) / 100.0)
+    except Exception:
+        return float(price)